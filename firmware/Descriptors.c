@@ -177,7 +177,7 @@ const USB_Descriptor_Configuration_t PROGMEM ConfigurationDescriptor = {
             .EndpointAddress        = JOYSTICK_IN_EPADDR,
             .Attributes             = (EP_TYPE_INTERRUPT | ENDPOINT_ATTR_NO_SYNC | ENDPOINT_USAGE_DATA),
             .EndpointSize           = JOYSTICK_EPSIZE,
-            .PollingIntervalMS      = 0x05
+            .PollingIntervalMS      = JOYSTICK_POLLING_INTERVAL
         },
 
     .HID_ReportOUTEndpoint =
@@ -187,7 +187,7 @@ const USB_Descriptor_Configuration_t PROGMEM ConfigurationDescriptor = {
             .EndpointAddress        = JOYSTICK_OUT_EPADDR,
             .Attributes             = (EP_TYPE_INTERRUPT | ENDPOINT_ATTR_NO_SYNC | ENDPOINT_USAGE_DATA),
             .EndpointSize           = JOYSTICK_EPSIZE,
-            .PollingIntervalMS      = 0x05
+            .PollingIntervalMS      = JOYSTICK_POLLING_INTERVAL
         },
 };
 
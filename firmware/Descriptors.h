@@ -41,6 +41,11 @@ enum StringDescriptors_t
 // The Switch -needs- this to be 64.
 // The Wii U is flexible, allowing us to use the default of 8 (which did not match the original Hori descriptors).
 #define JOYSTICK_EPSIZE           64
+// HID Endpoint Polling Interval in ms
+// The Hori pad uses 5. Lower values let the host collect reports more often.
+#ifndef JOYSTICK_POLLING_INTERVAL
+#define JOYSTICK_POLLING_INTERVAL 5
+#endif
 // Descriptor Header Type - HID Class HID Descriptor
 #define DTYPE_HID                 0x21
 // Descriptor Header Type - HID Class HID Report Descriptor
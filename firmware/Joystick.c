@@ -36,6 +36,10 @@ uint8_t LY2 = 0;     // Left  Stick Y
 uint8_t RX2 = 0;     // Right Stick X
 uint8_t RY2 = 0;     // Right Stick Y
 
+// Whether to tell the host each time a report is sent. The host can turn
+// this off with 'Q' and only send changes, since the last state is repeated.
+bool notify = true;
+
 // Use a circular buffer for the serial comms.
 volatile uint8_t buffer[256];
 volatile uint8_t buffer_head = 0;
@@ -84,6 +88,12 @@ void Serial_Task(void) {
 				if (c == 'P') {
 					// Ping request
 					putchar('P');
+				} else if (c == 'Q') {
+					// Quiet: stop sending 'S'
+					notify = false;
+				} else if (c == 'V') {
+					// Verbose: send 'S' after every report
+					notify = true;
 				}
 				// Ignore this character
 				continue;
@@ -234,7 +244,9 @@ void HID_Task(void) {
 		// We then send an IN packet on this endpoint.
 		Endpoint_ClearIN();
 		// Inform host that a packet was sent.
-		putchar('S');
+		if (notify) {
+			putchar('S');
+		}
 
 		/* Clear the report data afterwards */
 		// memset(&JoystickInputData, 0, sizeof(JoystickInputData));
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# latest controller states for twitch-control.py
+#
+# the website can send states much faster than the console reads them. each
+# controller has one slot which new states overwrite, and the slots are
+# flushed at most once per report interval, so serial writes are bounded by
+# the poll rate however fast states arrive. states which were overwritten
+# before they were flushed are counted as coalesced.
+
+import threading
+import time
+
+
+class LatestStates():
+
+	def __init__(self, interval=0.00833333):
+		self.interval = interval
+		self.lock = threading.Lock()
+
+		# key -> latest state not yet flushed
+		self.slots = {}
+		self.flushed = 0.0
+
+		self.received = 0
+		self.sent = 0
+		self.coalesced = 0
+
+	def put(self, key, state):
+		# returns when the next flush is due if one needs scheduling, otherwise None
+		with self.lock:
+			self.received += 1
+			if(key in self.slots):
+				self.coalesced += 1
+				self.slots[key] = state
+				return None
+			waiting = len(self.slots) > 0
+			self.slots[key] = state
+			if(waiting):
+				return None
+			return max(time.perf_counter(), self.flushed + self.interval)
+
+	def flush(self, send):
+		# calls send(key, state) once for each slot, and empties them
+		with self.lock:
+			slots = self.slots
+			self.slots = {}
+			self.flushed = time.perf_counter()
+			self.sent += len(slots)
+		for key, state in slots.items():
+			send(key, state)
+
+	def stats(self):
+		return "states: {} received, {} sent, {} coalesced".format(self.received, self.sent, self.coalesced)
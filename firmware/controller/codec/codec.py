@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# controller state codec for twitch-control.py
+#
+# the website sends states as text, eg "800000000000000 128 128 128 128":
+# the dpad, 14 button digits, then LX LY RX RY. decode() turns that into the
+# packed 7 byte state used by switchcon and the firmware (buttons, hat, lx,
+# ly, rx, ry as "<HBBBBB"), and text() turns a packed state back into the
+# text the serial controllers take. both go through tables built once, so
+# nothing is parsed a character at a time. a 7 byte packed state can also
+# be sent over the wire instead of the text.
+
+import struct
+
+STATE = struct.Struct("<HBBBBB")
+
+# switchcon State button bits
+Y			= 1 << 0
+B			= 1 << 1
+A			= 1 << 2
+X			= 1 << 3
+L			= 1 << 4
+R			= 1 << 5
+ZL			= 1 << 6
+ZR			= 1 << 7
+MINUS		= 1 << 8
+PLUS		= 1 << 9
+LSTICK		= 1 << 10
+RSTICK		= 1 << 11
+HOME		= 1 << 12
+CAPTURE		= 1 << 13
+ALL_BUTTONS	= 0x3fff
+
+# the button for each digit after the dpad in the text format
+WIRE_BUTTONS = [LSTICK, L, ZL, MINUS, CAPTURE, A, B, X, Y, RSTICK, R, ZR, PLUS, HOME]
+
+NEUTRAL = STATE.pack(0, 8, 128, 128, 128, 128)
+
+
+def digit_tables(buttons):
+	# maps each string of digits for these buttons to its bits, and back
+	decode = {}
+	encode = {}
+	for n in range(1 << len(buttons)):
+		digits = "".join("1" if n & (1 << i) else "0" for i in range(len(buttons)))
+		bits = 0
+		for i, button in enumerate(buttons):
+			if(n & (1 << i)):
+				bits |= button
+		decode[digits] = bits
+		encode[bits] = digits
+	mask = 0
+	for button in buttons:
+		mask |= button
+	return decode, encode, mask
+
+# the digits are split in two halves so the tables have 128 entries each
+LOW_DECODE, LOW_ENCODE, LOW_MASK = digit_tables(WIRE_BUTTONS[:7])
+HIGH_DECODE, HIGH_ENCODE, HIGH_MASK = digit_tables(WIRE_BUTTONS[7:])
+
+DPAD_DECODE = {str(n): n for n in range(9)}
+AXIS_DECODE = {str(n): n for n in range(256)}
+AXIS_INVERT = {str(n): 255 - n for n in range(256)}
+AXIS_TEXT = [" " + str(n) for n in range(256)]
+
+
+def clamp_axis(value, invert=False):
+	try:
+		n = min(255, max(0, int(value)))
+	except ValueError:
+		return 128
+	return 255 - n if invert else n
+
+def decode_slow(wire, buttons_mask, invert_y):
+	# anything the tables don't cover, eg missing fields or odd digits
+	parts = wire.split()
+	if(len(parts) == 0):
+		return NEUTRAL
+	field = parts[0]
+	hat = int(field[0]) if field[:1].isdigit() and int(field[0]) <= 8 else 8
+	buttons = 0
+	for i, button in enumerate(WIRE_BUTTONS):
+		if(field[i+1:i+2] == "1"):
+			buttons |= button
+	axes = [128, 128, 128, 128]
+	for i, value in enumerate(parts[1:5]):
+		axes[i] = clamp_axis(value, invert_y and i & 1)
+	return STATE.pack(buttons & buttons_mask, hat, *axes)
+
+def decode(wire, buttons_mask=ALL_BUTTONS, invert_y=True):
+	"""
+	Returns the packed state for a text or packed state from the wire.
+	Buttons which are not in buttons_mask are released. The website's text
+	has up as 255, so the Y axes are flipped unless invert_y is False.
+	Packed states are already the right way up.
+	"""
+	if(isinstance(wire, (bytes, bytearray))):
+		if(len(wire) != STATE.size):
+			return NEUTRAL
+		buttons, hat, lx, ly, rx, ry = STATE.unpack(wire)
+		return STATE.pack(buttons & buttons_mask, hat, lx, ly, rx, ry)
+
+	try:
+		field, lx, ly, rx, ry = wire.split()
+		axis_y = AXIS_INVERT if invert_y else AXIS_DECODE
+		return STATE.pack(
+			(LOW_DECODE[field[1:8]] | HIGH_DECODE[field[8:15]]) & buttons_mask,
+			DPAD_DECODE[field[0]],
+			AXIS_DECODE[lx], axis_y[ly], AXIS_DECODE[rx], axis_y[ry]
+		)
+	except (ValueError, KeyError):
+		return decode_slow(wire, buttons_mask, invert_y)
+
+def text(state):
+	# returns the serial text for a packed state
+	buttons, hat, lx, ly, rx, ry = STATE.unpack(state)
+	return (str(hat) + LOW_ENCODE[buttons & LOW_MASK] + HIGH_ENCODE[buttons & HIGH_MASK]
+		+ AXIS_TEXT[lx] + AXIS_TEXT[ly] + AXIS_TEXT[rx] + AXIS_TEXT[ry])
+
+def encode(buttons=0, hat=8, lx=128, ly=128, rx=128, ry=128):
+	# returns a packed state, eg for sending over the wire
+	return STATE.pack(buttons, hat, lx, ly, rx, ry)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# chat command table for twitch-control.py
+#
+# every chat command is compiled once into a tuple of frames. a frame is the
+# controller output string to send, the same string with zl held for lockon,
+# how long to hold it and whether to reset the controller afterwards.
+# multi-step moves like "long jump" are compiled into one sequence, so
+# looking up a command is a single dict lookup however many commands there are.
+
+from functools import lru_cache
+
+from switchcontroller.switchcontroller import *
+
+
+# left stick moves: prefix, duration, and whether the one letter names work too
+MOVE_DURATIONS = [("sss", 0.01, True), ("ss", 0.1, True), ("s", 0.3, True), ("", 0.6, True), ("h", 1.5, True), ("hh", 4.0, False)]
+MOVES = {
+	"left": ("l", {"LX": STICK_MIN}),
+	"right": ("r", {"LX": STICK_MAX}),
+	"up": ("u", {"LY": STICK_MIN}),
+	"down": ("d", {"LY": STICK_MAX}),
+}
+
+# right stick moves
+LOOK_DURATIONS = [("s", 0.1), ("", 0.3), ("h", 0.6)]
+LOOKS = {
+	"look left": ("ll", {"RX": STICK_MIN}),
+	"look right": ("lr", {"RX": STICK_MAX}),
+	"look up": ("lu", {"RY": STICK_MIN}),
+	"look down": ("ld", {"RY": STICK_MAX}),
+}
+
+DPADS = {
+	"dleft": ("dl", {"dpad": DPAD_LEFT}),
+	"dright": ("dr", {"dpad": DPAD_RIGHT}),
+	"dup": ("du", {"dpad": DPAD_UP}),
+	"ddown": ("dd", {"dpad": DPAD_DOWN}),
+}
+
+BUTTONS = [
+	("a", "a", 0.3), ("ha", "a", 0.5),
+	("sb", "b", 0.1), ("b", "b", 0.4), ("hb", "b", 0.5), ("hhb", "b", 0.8), ("hhhb", "b", 1.8),
+	("x", "x", 0.3), ("hx", "x", 0.5),
+	("y", "y", 0.3), ("hy", "y", 0.7),
+	("lstick", "lstick", 0.1), ("rstick", "rstick", 0.1),
+	("l", "l", 0.1), ("r", "r", 0.1), ("hr", "r", 1),
+	("zl", "zl", 0.1), ("zr", "zr", 0.1),
+	("minus", "minus", 0.1), ("plus", "plus", 0.1), ("home", "home", 0.1),
+]
+
+# moves made of several steps: name, fields, duration, reset, next step
+SPIN = [(STICK_CENTER, STICK_MIN), (STICK_MAX, STICK_MIN), (STICK_MAX, STICK_CENTER), (STICK_CENTER, STICK_MAX),
+		(STICK_MIN, STICK_MAX), (STICK_MIN, STICK_CENTER), (STICK_MIN, STICK_MIN), (STICK_CENTER, STICK_MIN)] * 2
+
+CHAINS = [
+	("long jump", {"LY": STICK_MIN}, 0.6, 0, "long jump2"),
+	("long jump2", {"LY": STICK_MIN, "zl": 1}, 0.01, 0, "long jump3"),
+	("long jump3", {"LY": STICK_MIN, "b": 1}, 0.1, 0, "long jump4"),
+	("long jump4", {"LY": STICK_MIN, "b": 1, "zl": 0}, 1, 1, None),
+	("jump forward", {"LY": STICK_MIN}, 0.3, 0, "jump forward2"),
+	("jump forward2", {"LY": STICK_MIN, "b": 1}, 0.4, 1, None),
+	("jump back", {"LY": STICK_MAX}, 0.3, 0, "jump forward2"),
+	("jump back2", {"LY": STICK_MAX, "b": 1}, 0.4, 1, None),
+	("sdive", {"zl": 1}, 0.1, 0, "sdive2"),
+	("sdive2", {"y": 1}, 0.1, 1, None),
+	("dive", {"b": 1}, 0.1, 0, "dive2"),
+	("dive2", {"zl": 1}, 0.01, 0, "dive3"),
+	("dive3", {"y": 1}, 0.1, 1, None),
+	("hdive", {"b": 1}, 0.2, 0, "hdive2"),
+	("hdive2", {"zl": 1}, 0.01, 0, "hdive3"),
+	("hdive3", {"y": 1}, 0.1, 1, None),
+	("roll", {"zl": 1}, 0.01, 0, "roll2"),
+	("roll2", {"y": 1}, 0.1, 1, None),
+	("backflip", {"zl": 1}, 0.01, 0, "backflip2"),
+	("bf", {"zl": 1}, 0.01, 0, "backflip2"),
+	("back flip", {"zl": 1}, 0.01, 0, "backflip2"),
+	("backflip2", {"b": 1}, 0.1, 1, None),
+	("ground pound", {"b": 1}, 0.01, 0, "ground pound2"),
+	("gp", {"b": 1}, 0.01, 0, "ground pound2"),
+	("groundpound", {"b": 1}, 0.01, 0, "ground pound2"),
+	("ground pound2", {"zl": 1}, 0.1, 1, None),
+	("sprint", {"LY": STICK_MIN, "b": 1}, 0.6, 1, None),
+	("hsprint", {"LY": STICK_MIN, "b": 1}, 1.5, 1, None),
+	("hhsprint", {"LY": STICK_MIN, "b": 1}, 3, 1, None),
+]
+for n, (lx, ly) in enumerate(SPIN):
+	CHAINS.append(("spin" + (str(n+1) if n else ""), {"LX": lx, "LY": ly}, 0.001, 0 if n < len(SPIN)-1 else 1, "spin" + str(n+2) if n < len(SPIN)-1 else None))
+
+# moves made of other commands
+MACROS = {
+	"cap bounce": ["b", "y", "sdive", "hy", "y", "sdive"],
+	"swim": ["b", "b", "b", "b"],
+}
+
+# parts of a "+" combo, keyed by name with the duration letters removed
+COMBO_FIELDS = {}
+for table in (MOVES, LOOKS, DPADS):
+	for name, (short, fields) in table.items():
+		COMBO_FIELDS[name.replace("s", "").replace("h", "")] = fields
+for attr in ["a", "b", "x", "y", "l", "r", "zl", "zr", "minus"]:
+	COMBO_FIELDS[attr.replace("s", "").replace("h", "")] = {attr: 1}
+
+
+class Frame(object):
+
+	__slots__ = ["output", "lockon", "duration", "reset"]
+
+	def __init__(self, output, lockon, duration, reset):
+		self.output = output
+		self.lockon = lockon
+		self.duration = duration
+		self.reset = reset
+
+	def __repr__(self):
+		return "Frame(" + repr(self.output) + ", " + str(self.duration) + ", " + str(self.reset) + ")"
+
+
+def build_frames(steps):
+	# play the steps on two scratch controllers, one of them with lockon
+	plain = SwitchController()
+	locked = SwitchController()
+	frames = []
+	for fields, duration, reset in steps:
+		locked.zl = 1
+		for controller in (plain, locked):
+			for attr, value in fields.items():
+				setattr(controller, attr, value)
+			controller.getOutput()
+		frames.append(Frame(plain.output, locked.output, duration, reset))
+		if(reset):
+			plain.reset()
+			locked.reset()
+	return tuple(frames)
+
+
+class CommandTable():
+
+	def __init__(self):
+		# name -> [fields, duration, reset, next step]
+		self.steps = {}
+
+		for prefix, duration, short in MOVE_DURATIONS:
+			for name, (letter, fields) in MOVES.items():
+				self.add([prefix + name] + ([prefix + letter] if short else []), fields, duration)
+		for name, (short, fields) in DPADS.items():
+			self.add([name, short], fields, 0.3)
+		for prefix, duration in LOOK_DURATIONS:
+			for name, (short, fields) in LOOKS.items():
+				self.add([prefix + name, prefix + short], fields, duration)
+		for name, attr, duration in BUTTONS:
+			self.add([name], {attr: 1}, duration)
+		for name, fields, duration, reset, then in CHAINS:
+			self.add([name], fields, duration, reset, then)
+
+		self.table = {name: build_frames(self.expand(name)) for name in self.steps}
+		for name, parts in MACROS.items():
+			self.table[name] = build_frames([step for part in parts for step in self.expand(part)])
+
+	def add(self, names, fields, duration, reset=1, then=None):
+		# a name which is added twice gets both sets of fields and the later duration
+		for name in names:
+			step = self.steps.setdefault(name, [{}, 0, 1, None])
+			step[0].update(fields)
+			step[1:] = [duration, reset, then]
+
+	def expand(self, name):
+		steps = []
+		while name is not None:
+			fields, duration, reset, name = self.steps[name]
+			steps.append((fields, duration, reset))
+		return steps
+
+	def get(self, cmd):
+		# returns the frames for a command, or () if it isn't one
+		if(not isinstance(cmd, str)):
+			return ()
+		frames = self.table.get(cmd)
+		if(frames is None):
+			frames = combo(cmd) if "+" in cmd else ()
+		return frames
+
+
+@lru_cache(maxsize=1024)
+def combo(cmd):
+	# buttons pressed together, eg "hb+left". the duration is set by the last button
+	fields = {}
+	duration = 0.3
+	for btn in [x.strip() for x in cmd.split("+")]:
+		duration = 0.3
+		if("s" in btn):
+			duration = 0.01
+		if("h" in btn):
+			duration = 0.6
+		if("hh" in btn):
+			duration = 1.5
+		if("hhh" in btn):
+			duration = 5
+		fields.update(COMBO_FIELDS.get(btn.replace("s", "").replace("h", ""), {}))
+	return build_frames([(fields, duration, 1)])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# per-user command queue for twitch-control.py
+#
+# each user has their own queue and users take turns, so one user spamming
+# commands only delays their own commands. commands which have waited longer
+# than max_age are dropped, so during a raid the stream keeps reacting to
+# what chat is typing now rather than what it typed minutes ago.
+
+import time
+from collections import deque
+
+
+class FairQueue():
+
+	def __init__(self, max_age=10.0, max_per_user=20):
+		self.max_age = max_age
+		self.max_per_user = max_per_user
+
+		# user -> deque of (time queued, command)
+		self.queues = {}
+		# users with commands waiting, in turn order
+		self.turns = deque()
+		# user -> commands they get per turn
+		self.weights = {}
+		# commands left in the current user's turn
+		self.credit = 0
+
+		self.depth = 0
+		self.queued = 0
+		self.sent = 0
+		self.dropped_old = 0
+		self.dropped_full = 0
+		self.wait_last = 0.0
+		self.wait_mean = 0.0
+		self.wait_max = 0.0
+
+	def __len__(self):
+		return self.depth
+
+	def put(self, user, cmd, weight=1):
+		self.weights[user] = weight
+		queue = self.queues.get(user)
+		if(queue is None):
+			queue = self.queues[user] = deque()
+			self.turns.append(user)
+		elif(len(queue) >= self.max_per_user):
+			# drop the user's oldest command to make room
+			queue.popleft()
+			self.depth -= 1
+			self.dropped_full += 1
+		queue.append((time.monotonic(), cmd))
+		self.depth += 1
+		self.queued += 1
+
+	def get(self):
+		# returns the next command, or None if there isn't one
+		now = time.monotonic()
+		while(len(self.turns) > 0):
+			user = self.turns[0]
+			queue = self.queues[user]
+			queued, cmd = queue.popleft()
+			self.depth -= 1
+
+			if(self.credit <= 0):
+				self.credit = self.weights[user]
+			self.credit -= 1
+
+			if(len(queue) == 0):
+				del self.queues[user]
+				del self.weights[user]
+				self.turns.popleft()
+				self.credit = 0
+			elif(self.credit <= 0):
+				self.turns.rotate(-1)
+
+			wait = now - queued
+			if(wait > self.max_age):
+				self.dropped_old += 1
+				continue
+
+			self.sent += 1
+			self.wait_last = wait
+			self.wait_mean += (wait - self.wait_mean)*0.05
+			self.wait_max = max(self.wait_max, wait)
+			return cmd
+		return None
+
+	def stats(self):
+		stats = "queue: {} commands from {} users, {} queued, {} sent, {} dropped old, {} dropped full, wait {:.2f}s last {:.2f}s mean {:.2f}s max".format(
+			self.depth, len(self.queues), self.queued, self.sent, self.dropped_old, self.dropped_full, self.wait_last, self.wait_mean, self.wait_max)
+		self.wait_max = 0.0
+		return stats
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# saved username lists for twitch-control.py
+#
+# a list is kept in memory as a set and saved as a journal: one line per
+# change, "+name" or "-name", appended to the end of the file. saving a
+# change only writes that one line. when the journal gets much longer than
+# the list, it is rewritten with just the current names.
+
+import os
+
+
+class Journal():
+
+	def __init__(self, filename, compact_every=1000):
+		self.filename = filename
+		self.compact_every = compact_every
+		self.users = set()
+		self.lines = 0
+		self.new = not os.path.exists(filename)
+
+		torn = False
+		if(not self.new):
+			with open(filename, "r", encoding="utf-8") as f:
+				for line in f:
+					# a line without a newline was cut off by a crash
+					if(not line.endswith("\n")):
+						torn = True
+						break
+					name = line[1:-1]
+					if(line[0] == "+"):
+						self.users.add(name)
+					elif(line[0] == "-"):
+						self.users.discard(name)
+					self.lines += 1
+
+		self.file = None
+		# rewrite a torn journal, or the next line would be appended to the cut off one
+		if(torn or self.lines > len(self.users) + self.compact_every):
+			self.compact()
+		else:
+			self.file = open(filename, "a", encoding="utf-8")
+
+	def __contains__(self, user):
+		return user in self.users
+
+	def __len__(self):
+		return len(self.users)
+
+	def add(self, user):
+		# returns True if the user wasn't already in the list
+		if(user in self.users):
+			return False
+		self.users.add(user)
+		self.write("+" + user)
+		return True
+
+	def remove(self, user):
+		# returns True if the user was in the list
+		if(user not in self.users):
+			return False
+		self.users.discard(user)
+		self.write("-" + user)
+		return True
+
+	def write(self, line):
+		self.file.write(line + "\n")
+		self.file.flush()
+		self.lines += 1
+		if(self.lines > len(self.users) + self.compact_every):
+			self.compact()
+
+	def compact(self):
+		# rewrite the file with only the current names
+		if(self.file is not None):
+			self.file.close()
+		tmp = self.filename + ".tmp"
+		with open(tmp, "w", encoding="utf-8") as f:
+			for user in sorted(self.users):
+				f.write("+" + user + "\n")
+		os.replace(tmp, self.filename)
+		self.lines = len(self.users)
+		self.file = open(self.filename, "a", encoding="utf-8")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# user roles for twitch-control.py
+#
+# each role is a set of usernames, and each user's roles are combined into
+# a bitmask the first time they are looked up. the bitmask is cached until
+# one of the user's roles changes, so checking a user costs one dict lookup
+# however long the lists get.
+#
+# a role can be saved to a Journal, which then holds the set of users. the
+# roles which changed since the last call to changed() are tracked, so only
+# those lists need to be sent to the server.
+#
+# roles are looked up from the socketio thread as well as the main thread,
+# so recomputing a bitmask and changing a role both hold the lock. otherwise
+# a recompute could cache a stale bitmask just after a change dropped it.
+
+import threading
+
+MOD		= 0x01
+ADMIN	= 0x02
+PLUS	= 0x04
+BANNED	= 0x08
+SUB		= 0x10
+
+ROLES = [MOD, ADMIN, PLUS, BANNED, SUB]
+
+
+class Permissions():
+
+	def __init__(self):
+		self.users = {role: set() for role in ROLES}
+		self.journals = {}
+		self.cache = {}
+		self.dirty = set()
+		self.lock = threading.Lock()
+
+	def role(self, user):
+		# returns the bitmask of the user's roles
+		role = self.cache.get(user)
+		if(role is None):
+			with self.lock:
+				role = 0
+				for r in ROLES:
+					if(user in self.users[r]):
+						role |= r
+				self.cache[user] = role
+		return role
+
+	def has(self, user, role):
+		return (self.role(user) & role) != 0
+
+	def persist(self, role, journal):
+		# load the role's users from a journal and save changes to it
+		with self.lock:
+			for user in self.users[role]:
+				journal.add(user)
+			self.users[role] = journal.users
+			self.journals[role] = journal
+			self.cache.clear()
+
+	def add(self, role, *users):
+		journal = self.journals.get(role)
+		with self.lock:
+			for user in users:
+				if(user in self.users[role]):
+					continue
+				if(journal is not None):
+					journal.add(user)
+				else:
+					self.users[role].add(user)
+				self.cache.pop(user, None)
+				self.dirty.add(role)
+
+	def remove(self, role, *users):
+		journal = self.journals.get(role)
+		with self.lock:
+			for user in users:
+				if(user not in self.users[role]):
+					continue
+				if(journal is not None):
+					journal.remove(user)
+				else:
+					self.users[role].discard(user)
+				self.cache.pop(user, None)
+				self.dirty.add(role)
+
+	def changed(self):
+		# returns the roles which changed since the last call
+		with self.lock:
+			dirty = self.dirty
+			self.dirty = set()
+		return dirty
+
+	def names(self, role):
+		# returns a sorted list of the users with a role, for sending and saving
+		return sorted(self.users[role])
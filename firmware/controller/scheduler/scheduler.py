@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# timed controller actions for twitch-control.py
+#
+# instead of busy-waiting while a button is held, the button is pressed
+# straight away and its release is pushed onto a heap of deadlines. one
+# thread sleeps until the earliest deadline and runs it, so holds on all
+# the controllers run at the same time and nothing spins.
+
+import ctypes
+import heapq
+import sys
+import threading
+import time
+
+
+class Scheduler():
+
+	def __init__(self):
+		# held while an action runs, and by anything changing a controller which has one pending
+		self.lock = threading.RLock()
+		self.cond = threading.Condition(self.lock)
+
+		self.heap = []
+		self.pending = {}
+		self.count = 0
+
+		if(sys.platform == "win32"):
+			# 1ms timer resolution instead of 15.6ms
+			ctypes.windll.winmm.timeBeginPeriod(1)
+
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def call_at(self, deadline, key, action):
+		# run action at deadline (a time.perf_counter() time), replacing anything pending for key
+		with self.cond:
+			self.count += 1
+			self.pending[key] = self.count
+			heapq.heappush(self.heap, (deadline, self.count, key, action))
+			self.cond.notify_all()
+
+	def call_later(self, delay, key, action):
+		self.call_at(time.perf_counter() + delay, key, action)
+
+	def cancel(self, key):
+		with self.cond:
+			self.pending.pop(key, None)
+			self.cond.notify_all()
+
+	def busy(self, key):
+		return key in self.pending
+
+	def wait(self, key):
+		# block until nothing is pending for key, eg until a button has been released
+		with self.cond:
+			while(key in self.pending):
+				self.cond.wait()
+
+	def run(self):
+		heap = self.heap
+		with self.cond:
+			while True:
+				# drop entries which were cancelled or replaced
+				while(len(heap) > 0 and self.pending.get(heap[0][2]) != heap[0][1]):
+					heapq.heappop(heap)
+
+				if(len(heap) == 0):
+					self.cond.wait()
+					continue
+
+				delay = heap[0][0] - time.perf_counter()
+				if(delay > 0):
+					self.cond.wait(delay)
+					continue
+
+				deadline, count, key, action = heapq.heappop(heap)
+				del self.pending[key]
+				try:
+					action()
+				except Exception as e:
+					print("scheduler error:", e)
+				self.cond.notify_all()
@@ -10,6 +10,26 @@ from switchcontroller.switchcontroller import *
 # twitch:
 from twitchbot.twitchbot import *
 
+# chat commands:
+from commands.commands import *
+
+# timed button releases:
+from scheduler.scheduler import *
+
+# per-user command queue:
+from fairqueue.fairqueue import *
+
+# anarchy / democracy:
+from votes.votes import *
+
+# mods, plus users, bans:
+from permissions.permissions import *
+from journal.journal import *
+
+# controller states from the website:
+from codec import codec
+from coalesce.coalesce import *
+
 # socketio
 from socketIO_client_nexus import SocketIO, LoggingNamespace, BaseNamespace
 import logging
@@ -17,6 +37,7 @@ import logging
 logging.basicConfig()
 
 from threading import Thread
+from collections import deque
 
 # OpenCV / image utils:
 import imutils
@@ -57,6 +78,10 @@ controller1 = SwitchController()
 controller2 = SwitchController()
 controller3 = SwitchController()
 controller4 = SwitchController()
+controllers = [controller1, controller2, controller3, controller4]
+
+scheduler = Scheduler()
+controllerStates = LatestStates()
 
 try:
 	controller1.connect("COM3")
@@ -89,33 +114,59 @@ def delayed_reset(delay=0.1):
 	Timer(delay, controller1.reset).start()
 
 
-def accurateSleep(duration):
-	s = time.clock()
-	e = time.clock()
-	diffInMilliSeconds = 0
-
-	while (diffInMilliSeconds < duration):
-		e = time.clock()
-		diffInMilliSeconds = (e - s)*1000
+def release(controller):
+	controller.reset()
+	controller.getOutput()
+	controller.send(controller.output)
 
+# durations are in milliseconds, as accurateSleep() used to take them
 def send_and_reset(duration=0.1, reset=1, cNum=0):
-	controller = None
-	if (cNum == 0):
-		controller = controller1
-	elif (cNum == 1):
-		controller = controller2
-	elif (cNum == 2):
-		controller = controller3
-	elif (cNum == 3):
-		controller = controller4
+	controller = controllers[cNum]
 
-	controller.getOutput()
-	controller.send(controller.output)
-	accurateSleep(duration)
-	if(reset):
-		controller.reset()
+	with scheduler.lock:
+		scheduler.cancel(cNum)
 		controller.getOutput()
 		controller.send(controller.output)
+		if(reset):
+			scheduler.call_later(duration/1000, cNum, lambda: release(controller))
+
+def press(duration=0.1, cNum=0, **inputs):
+	# for scripted sequences: sets inputs on a reset controller, holds them for
+	# duration ms and waits until they are released before returning
+	controller = controllers[cNum]
+
+	with scheduler.lock:
+		controller.reset()
+		for name, value in inputs.items():
+			setattr(controller, name, value)
+		send_and_reset(duration, 1, cNum)
+	scheduler.wait(cNum)
+
+def send_state(state, cNum=0):
+	# sends a packed state straight to the controller, with no release
+	controller = controllers[cNum]
+
+	with scheduler.lock:
+		scheduler.cancel(cNum)
+		controller.output = codec.text(state)
+		controller.send(controller.output)
+
+def flush_states():
+	controllerStates.flush(lambda cNum, state: send_state(state, cNum))
+
+def queue_state(state, cNum=0):
+	# keeps only the latest state for each controller until the next flush
+	deadline = controllerStates.put(cNum, state)
+	if(deadline is not None):
+		scheduler.call_at(deadline, "states", flush_states)
+
+def send_frame(output, duration=0.1, reset=1):
+	with scheduler.lock:
+		scheduler.cancel(0)
+		controller1.output = output
+		controller1.send(output)
+		if(reset):
+			scheduler.call_later(duration/1000, 0, lambda: release(controller1))
 
 def round_down(num, divisor):
     return num - (num % divisor)
@@ -123,29 +174,30 @@ def round_down(num, divisor):
 
 
 gotoList = ["snipperclips", "mk8", "human", "shovel", "octopath", "explosion", "jackbox4", "jackbox3", "fallout", "skyrim", "splatoon2", "celeste", "smo", "rocketleague", "pokemonquest", "wizard", "sonic", "arms", "kirby", "fortnite", "torquel", "botw"]
-validCommands = ["!setforfeitlength", "!setturnlength", "!banlist", "!disableinternet", "!enableinternet", "!forcerefresh", "nay", "yea", "!enablechat", "!disablechat", "!enablegoto", "!disablegoto", "!unmod", "!mod", "!fixcontrollers", "!goto snipperclips", "!pluslist", "!unban", "!ban", "!removeplus", "!giveplus", "!goto human", "!goto shovel", "!goto octopath", "!goto explosion", "!goto jackbox4", "!goto jackbox3", "!commands", "!goto fallout", "!goto fortnite", "!goto torquel", "!goto pokemonquest", "!restart", "!restart1", "!restart2", "!restart3", "!restartscript", "!restartserver", "!help", "votenay", "voteyea", "!goto wizard", "!goto cave", "!goto sonic", "!goto skyrim", "!goto rocketleague", "!goto arms", "!goto celeste", "!goto mk8", "!goto splatoon2", "!goto isaac", "!goto mario", "!goto botw", "!goto kirby", "!goto smo", "!goto", "lockon", "hhsprint", "hsprint", "sprint", "!controls", "!goto", "home", "lstick", "rstick", "spin", "swim", "back flip", "ground pound", "groundpound", "gp", "bf", "cap bounce", "sdive", "sdive2", "hdive", "hdive2", "hdive3", "dive", "dive2", "dive3", "roll", "roll2", "backflip", "backflip2", "sssu", "sssd", "sssl", "sssr", "sb", "suu", "", "up", "down", "left", "right", "u", "d", "l", "r", "hup", "hdown", "hleft", "hright", "hhup", "hhdown", "hhleft", "hhright", "hu", "hd", "hl", "hr", "su", "sd", "sl", "sr", "sup", "sdown", "sleft", "sright", "ssu", "ssd", "ssl", "ssr", "ssup", "ssdown", "ssleft", "ssright", "look up", "look down", "look left", "look right", "lu", "ld", "ll", "lr", "hlu", "hld", "hll", "hlr", "slu", "sld", "sll", "slr", "dup", "ddown", "dleft", "dright", "du", "dd", "dl", "dr", "a", "b", "x", "y", "ha", "hb", "hx", "hy", "hhb", "hhhb", "l", "zl", "r", "zr", "plus", "minus", "long jump", "long jump2", "long jump3", "jump forward", "jump forward2", "jump back", "jump back2", "dive", "dive2"]
-pluslist = []
-modlist = ["alua2020", "ogcristofer", "stravos96", "yanchan230", "silvermagpi", "twitchplaysconsoles", "fosseisanerd", "tpnsbot"]
-adminlist = ["silvermagpi", "twitchplaysconsoles", "fosseisanerd"]
-banlist = []
-sublist = []
-voted = []
+validCommands = {"!anarchy", "!democracy", "!setforfeitlength", "!setturnlength", "!banlist", "!disableinternet", "!enableinternet", "!forcerefresh", "nay", "yea", "!enablechat", "!disablechat", "!enablegoto", "!disablegoto", "!unmod", "!mod", "!fixcontrollers", "!goto snipperclips", "!pluslist", "!unban", "!ban", "!removeplus", "!giveplus", "!goto human", "!goto shovel", "!goto octopath", "!goto explosion", "!goto jackbox4", "!goto jackbox3", "!commands", "!goto fallout", "!goto fortnite", "!goto torquel", "!goto pokemonquest", "!restart", "!restart1", "!restart2", "!restart3", "!restartscript", "!restartserver", "!help", "votenay", "voteyea", "!goto wizard", "!goto cave", "!goto sonic", "!goto skyrim", "!goto rocketleague", "!goto arms", "!goto celeste", "!goto mk8", "!goto splatoon2", "!goto isaac", "!goto mario", "!goto botw", "!goto kirby", "!goto smo", "!goto", "lockon", "hhsprint", "hsprint", "sprint", "!controls", "!goto", "home", "lstick", "rstick", "spin", "swim", "back flip", "ground pound", "groundpound", "gp", "bf", "cap bounce", "sdive", "sdive2", "hdive", "hdive2", "hdive3", "dive", "dive2", "dive3", "roll", "roll2", "backflip", "backflip2", "sssu", "sssd", "sssl", "sssr", "sb", "suu", "", "up", "down", "left", "right", "u", "d", "l", "r", "hup", "hdown", "hleft", "hright", "hhup", "hhdown", "hhleft", "hhright", "hu", "hd", "hl", "hr", "su", "sd", "sl", "sr", "sup", "sdown", "sleft", "sright", "ssu", "ssd", "ssl", "ssr", "ssup", "ssdown", "ssleft", "ssright", "look up", "look down", "look left", "look right", "lu", "ld", "ll", "lr", "hlu", "hld", "hll", "hlr", "slu", "sld", "sll", "slr", "dup", "ddown", "dleft", "dright", "du", "dd", "dl", "dr", "a", "b", "x", "y", "ha", "hb", "hx", "hy", "hhb", "hhhb", "l", "zl", "r", "zr", "plus", "minus", "long jump", "long jump2", "long jump3", "jump forward", "jump forward2", "jump back", "jump back2", "dive", "dive2"}
+permissions = Permissions()
+permissions.add(MOD, "alua2020", "ogcristofer", "stravos96", "yanchan230", "silvermagpi", "twitchplaysconsoles", "fosseisanerd", "tpnsbot")
+permissions.add(ADMIN, "silvermagpi", "twitchplaysconsoles", "fosseisanerd")
 singlePlayerGames = ["The Legend of Zelda: Breath of the Wild"]
 
-commandQueue = []
-nextCommands = []
+commandQueue = FairQueue()
+nextCommands = deque()
+commandTable = CommandTable()
 #lockon = False
 oldArgs = "800000000000000 128 128 128 128"
 
 
-# load plus list:
-if(os.path.exists("pluslist.pkl")):
-    with open("pluslist.pkl", "rb") as f:
-        pluslist = pickle.load(f)[0]
-# load ban list:
-if(os.path.exists("banlist.pkl")):
-    with open("banlist.pkl", "rb") as f:
-        banlist = pickle.load(f)[0]
+# load plus and ban lists, moving them over from the old pickle files the first time:
+for role, name in [(PLUS, "pluslist"), (BANNED, "banlist")]:
+	journal = Journal(name + ".txt")
+	if(journal.new and os.path.exists(name + ".pkl")):
+		with open(name + ".pkl", "rb") as f:
+			for user in pickle.load(f)[0]:
+				journal.add(user)
+	permissions.persist(role, journal)
+
+# socketio events for sending each list
+listEvents = {BANNED: "banlist", MOD: "modlist", PLUS: "pluslist", SUB: "sublist"}
 
 
 class Client(object):
@@ -158,11 +210,8 @@ class Client(object):
 		self.socketio.on("controllerState3", self.on_controller_state3)
 		self.socketio.on("controllerState4", self.on_controller_state4)
 		self.socketio.on("turnTimesLeft", self.on_turn_times_left)
-		self.socketio.emit("joinSecure", {"room": "controller", "password": ROOM_SECRET})
-		self.socketio.emit("banlist", banlist)
-		self.socketio.emit("modlist", modlist)
-		self.socketio.emit("pluslist", pluslist)
-		self.socketio.emit("sublist", sublist)
+		self.socketio.on("reconnect", self.join)
+		self.join()
 
 		self.receive_events_thread = Thread(target=self._receive_events_thread)
 		self.receive_events_thread.daemon = True
@@ -174,14 +223,12 @@ class Client(object):
 		self.botstart = time.clock()
 		self.botend = time.clock()
 
-		self.controllerStart = time.clock()
-		self.controllerEnd = time.clock()
-
 		self.lockon = False
+		self.frames = deque()
 
-		self.yeaVotes = 0
-		self.nayVotes = 0
+		self.gotoVotes = VoteWindow()
 		self.voting = False
+		self.voteEngine = VoteEngine(self.queue_commands)
 		self.gotoUsed = False
 		self.chatEnabled = True
 		self.controllerEnabled = True
@@ -192,6 +239,13 @@ class Client(object):
 		self.oldArgs2 = "800000000000000 128 128 128 128"
 
 
+	def join(self, *args):
+		# join the controller room and send all the lists, on startup and when the socket reconnects.
+		# changes after that are sent by loop(), so the dirty roles are left for it
+		self.socketio.emit("joinSecure", {"room": "controller", "password": ROOM_SECRET})
+		for role, event in listEvents.items():
+			self.socketio.emit(event, permissions.names(role))
+
 	def _receive_events_thread(self):
 		self.socketio.wait()		
 
@@ -225,97 +279,23 @@ class Client(object):
 
 		client.oldArgs2 = state
 
-		controller = None
-
-		if(cNum == 0):
-			controller = controller1
-		elif(cNum == 1):
-			controller = controller2
-		elif(cNum == 2):
-			controller = controller3
-		elif(cNum == 3):
-			controller = controller4
-
-		controller.reset()
-
-		inputs = state.split()
-		cPlayer = ""
+		role = 0
 		try:
-			cPlayer = client.currentPlayers[cNum]
+			role = permissions.role(client.currentPlayers[cNum].lower())
 		except:
 			pass
 
-		if (state == "800000000000000 128 128 128 128"):
-			controller.reset()
-			controller.getOutput()
-			controller.send(controller.output)
-			return
-
-		btns = inputs[0]
-		LX = inputs[1]
-		LY = inputs[2]
-		RX = inputs[3]
-		RY = inputs[4]
-
-		controller.dpad = int(btns[0])
-		if (btns[1] == "1"):
-			controller.lstick = 1;
-		if (btns[2] == "1"):
-			controller.l = 1;
-		if (btns[3] == "1"):
-			controller.zl = 1;
-		if (btns[4] == "1"):
-			controller.minus = 1;
-		if (btns[5] == "1"):
-			try:
-				if (cPlayer.lower() in modlist):
-					controller.capture = 1
-				else:
-					controller.capture = 0
-			except:
-				controller.capture = 0
-		if (btns[6] == "1"):
-			controller.a = 1;
-		if (btns[7] == "1"):
-			controller.b = 1;
-		if (btns[8] == "1"):
-			controller.x = 1;
-		if (btns[9] == "1"):
-			controller.y = 1;
-		if (btns[10] == "1"):
-			controller.rstick = 1;
-		if (btns[11] == "1"):
-			controller.r = 1;
-		if (btns[12] == "1"):
-			controller.zr = 1;
-		if (btns[13] == "1"):
-			try:
-				if (cPlayer.lower() in pluslist):
-					controller.plus = 1
-				else:
-					controller.plus = 0
-			except:
-				controller.plus = 0
-		if (btns[14] == "1"):
-			try:
-				if (cPlayer.lower() in modlist):
-					controller.home = 1
-				else:
-					controller.home = 0
-			except:
-				controller.home = 0
-
-		try:
-			controller.LX = int(LX)
-			controller.LY = 255-int(LY)
-			controller.RX = int(RX)
-			controller.RY = 255-int(RY)
-		except:
-			pass
+		# only mods can press capture and home, and only plus users can press plus
+		mask = codec.ALL_BUTTONS
+		if(not role & MOD):
+			mask &= ~(codec.CAPTURE | codec.HOME)
+		if(not role & PLUS):
+			mask &= ~codec.PLUS
 
-		duration = 0.001
-		reset = 0
-		send_and_reset(duration, reset, cNum)
+		if (state == "800000000000000 128 128 128 128"):
+			queue_state(codec.NEUTRAL, cNum)
+		else:
+			queue_state(codec.decode(state, mask), cNum)
 
 
 	# player 1:
@@ -404,17 +384,13 @@ class Client(object):
 		self.controllerEnabled = False
 		self.chatEnabled = False
 		# set voted players to none
-		del voted[:]
+		self.gotoVotes = VoteWindow()
 
 		# get to game selection screen:
-		controller1.reset()
-		controller1.home = 1
-		send_and_reset(0.1, 1)
+		press(0.1, home=1)
 		sleep(2)
-		controller1.LX = STICK_MAX
-		send_and_reset(3, 1)
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(3, LX=STICK_MAX)
+		press(0.1, a=1)
 
 		sleep(2)
 
@@ -468,17 +444,13 @@ class Client(object):
 
 			# move down and try again:
 			# move down 3 times and up once:
-			controller1.LY = STICK_MAX
-			send_and_reset(0.1, 1)
+			press(0.1, LY=STICK_MAX)
 			sleep(0.5)
-			controller1.LY = STICK_MAX
-			send_and_reset(0.1, 1)
+			press(0.1, LY=STICK_MAX)
 			sleep(0.5)
-			controller1.LY = STICK_MAX
-			send_and_reset(0.1, 1)
+			press(0.1, LY=STICK_MAX)
 			sleep(0.5)
-			controller1.LY = STICK_MIN
-			send_and_reset(0.1, 1)
+			press(0.1, LY=STICK_MIN)
 			sleep(0.5)
 
 
@@ -514,17 +486,13 @@ class Client(object):
 
 				# move down and try again:
 				# move down 3 times and up once:
-				controller1.LY = STICK_MAX
-				send_and_reset(0.1, 1)
+				press(0.1, LY=STICK_MAX)
 				sleep(0.5)
-				controller1.LY = STICK_MAX
-				send_and_reset(0.1, 1)
+				press(0.1, LY=STICK_MAX)
 				sleep(0.5)
-				controller1.LY = STICK_MAX
-				send_and_reset(0.1, 1)
+				press(0.1, LY=STICK_MAX)
 				sleep(0.5)
-				controller1.LY = STICK_MIN
-				send_and_reset(0.1, 1)
+				press(0.1, LY=STICK_MIN)
 				sleep(0.5)
 
 				wDC = win32gui.GetWindowDC(hwnd)
@@ -558,17 +526,13 @@ class Client(object):
 				if iconLoc == None:
 					# move down and try again:
 					# move down 3 times and up once:
-					controller1.LY = STICK_MAX
-					send_and_reset(0.1, 1)
+					press(0.1, LY=STICK_MAX)
 					sleep(0.5)
-					controller1.LY = STICK_MAX
-					send_and_reset(0.1, 1)
+					press(0.1, LY=STICK_MAX)
 					sleep(0.5)
-					controller1.LY = STICK_MAX
-					send_and_reset(0.1, 1)
+					press(0.1, LY=STICK_MAX)
 					sleep(0.5)
-					controller1.LY = STICK_MIN
-					send_and_reset(0.1, 1)
+					press(0.1, LY=STICK_MIN)
 					sleep(0.5)
 					
 					wDC = win32gui.GetWindowDC(hwnd)
@@ -600,10 +564,8 @@ class Client(object):
 
 					# give up if we still can't find it:
 					if iconLoc == None:
-						controller1.LY = STICK_MIN
-						send_and_reset(1.5, 1)
-						controller1.a = 1
-						send_and_reset(0.1)
+						press(1.5, LY=STICK_MIN)
+						press(0.1, a=1)
 						self.controllerEnabled = True
 						return
 
@@ -628,48 +590,33 @@ class Client(object):
 
 
 		for i in range(0, iconLoc[0]):
-			controller1.LX = STICK_MAX
-			send_and_reset(0.1, 1)
+			press(0.1, LX=STICK_MAX)
 			sleep(0.5)
 		for i in range(0, iconLoc[1]):
-			controller1.LY = STICK_MAX
-			send_and_reset(0.1, 1)
+			press(0.1, LY=STICK_MAX)
 			sleep(0.5)
 
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(0.1, a=1)
 		sleep(2)
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(0.1, a=1)
 		sleep(2)
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(0.1, a=1)
 		sleep(2)
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(0.1, a=1)
 		sleep(2)
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(0.1, a=1)
 		sleep(2)
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(0.1, a=1)
 		sleep(delay)
-		controller1.a = 1
-		send_and_reset(0.1)
-		controller1.a = 1
-		send_and_reset(0.1)
-		controller1.a = 1
-		send_and_reset(0.1)
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(0.1, a=1)
+		press(0.1, a=1)
+		press(0.1, a=1)
+		press(0.1, a=1)
 		sleep(2)
-		controller1.a = 1
-		send_and_reset(0.1)
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(0.1, a=1)
+		press(0.1, a=1)
 		sleep(2)
-		controller1.a = 1
-		send_and_reset(0.1)
+		press(0.1, a=1)
 
 		twitchBot.chat("!game " + nameofgame)
 
@@ -695,12 +642,14 @@ class Client(object):
 
 	def end_goto_vote(self, imagefile, delay, nameofgame="Twitch Plays"):
 		# twitchBot.chat("Voting has ended!")
-		msg = "With " + str(self.yeaVotes) + " VoteYea and " + str(self.nayVotes) + " VoteNay"
+		yeaVotes = self.gotoVotes.count("yea")
+		nayVotes = self.gotoVotes.count("nay")
+		msg = "With " + str(yeaVotes) + " VoteYea and " + str(nayVotes) + " VoteNay"
 		
 		leaving = False
 		timeGotoisDisabled = 0
 
-		if(self.yeaVotes > self.nayVotes):
+		if(yeaVotes > nayVotes):
 			msg = msg + " We will be LEAVING"
 			leaving = True
 			timeGotoisDisabled = 8*60
@@ -716,7 +665,7 @@ class Client(object):
 
 		self.voting = False
 
-		del voted[:]
+		self.gotoVotes = VoteWindow()
 
 		if(leaving):
 			self.goto_game(imagefile, delay, nameofgame)
@@ -737,8 +686,7 @@ class Client(object):
 			twitchBot.chat(msg)
 			return
 
-		self.yeaVotes = 0
-		self.nayVotes = 0
+		self.gotoVotes = VoteWindow()
 		twitchBot.chat("A vote has been started to goto " + nameofgame + "! Vote now with VoteYea to LEAVE and VoteNay to STAY! Voting ends in 20 seconds!")
 		self.voting = True
 
@@ -752,6 +700,8 @@ class Client(object):
 	def handleChat(self, username, message):
 		print(username + ": " + message)
 
+		role = permissions.role(username)
+
 
 		commands = None
 		if ("," in message):
@@ -771,109 +721,94 @@ class Client(object):
 			twitchBot.chat(msg)
 
 		if(len(commands) == 1 and commands[0] == "!commands"):
-			msg = "(mods only): \"!restartscript\", \"!restartserver\" \"!giveplus [user]\", \"!ban [user]\", \"!unban [user]\", \"!removeplus [user]\", \"!disablechat\", \"!enablechat\", \"!disablegoto\", \"!enablegoto\", \"!setturnlength [lengthInMS]\", \"!setforfeitlength [lengthInMS]\" (plus only): \"!disableinternet\", \"!enableinternet\", \"!fixcontrollers\" (anyone): \"!restart1\", \"!restart2\", \"!restart3\", \"!pluslist\", \"!banlist\", \"!goto [game]\""
+			msg = "(mods only): \"!restartscript\", \"!restartserver\" \"!giveplus [user]\", \"!ban [user]\", \"!unban [user]\", \"!removeplus [user]\", \"!disablechat\", \"!enablechat\", \"!disablegoto\", \"!enablegoto\", \"!setturnlength [lengthInMS]\", \"!setforfeitlength [lengthInMS]\", \"!anarchy\", \"!democracy [lengthInMS]\" (plus only): \"!disableinternet\", \"!enableinternet\", \"!fixcontrollers\" (anyone): \"!restart1\", \"!restart2\", \"!restart3\", \"!pluslist\", \"!banlist\", \"!goto [game]\""
 			twitchBot.chat(msg)
 
 		valid = True
 		for cmd in commands:
 			if (cmd not in validCommands and "+" not in cmd):
 				valid = False
-			if ("plus" in cmd and username not in pluslist):
+			if ("plus" in cmd and not role & PLUS):
 				valid = False
-			if ("home" in cmd and username not in modlist):
+			if ("home" in cmd and not role & MOD):
 				valid = False
 
-			if ("!restartserver" in cmd and username not in modlist):
+			if ("!restartserver" in cmd and not role & MOD):
 				valid = False
-			if ("!restartscript" in cmd and username not in modlist):
+			if ("!restartscript" in cmd and not role & MOD):
 				valid = False
 
-			if ("!enablegoto" in cmd and username not in modlist):
+			if ("!enablegoto" in cmd and not role & MOD):
 				valid = False
-			if ("!disablegoto" in cmd and username not in modlist):
+			if ("!disablegoto" in cmd and not role & MOD):
 				valid = False
 
 			if ("lockon" in cmd):
 				self.lockon = not self.lockon
 
 			if(self.voting):
-				if((cmd == "voteyea" or cmd == "yea") and username not in voted):
-					voted.append(username)
-					self.yeaVotes += 1
-				if((cmd == "votenay" or cmd == "nay") and username not in voted):
-					voted.append(username)
-					self.nayVotes += 1
+				if(cmd == "voteyea" or cmd == "yea"):
+					self.gotoVotes.vote(username, "yea")
+				if(cmd == "votenay" or cmd == "nay"):
+					self.gotoVotes.vote(username, "nay")
 
 		if len(commands) == 2:
 
-			if (commands[0] == "!giveplus" and username in modlist):
+			if (commands[0] == "!giveplus" and role & MOD):
 
 				msg = "Giving plus permission to: " + commands[1]
 				twitchBot.chat(msg)
 
-				pluslist.append(commands[1])
-
-				# write pluslist to file:
-				with open("pluslist.pkl", "wb") as f:
-					pickle.dump([pluslist], f)
+				permissions.add(PLUS, commands[1])
 
-			if (commands[0] == "!removeplus" and username in modlist):
+			if (commands[0] == "!removeplus" and role & MOD):
 
 				msg = "Removing plus permissions from: " + commands[1]
 				twitchBot.chat(msg)
 
 				# revoke plus permission:
-				if commands[1] in pluslist:
-					pluslist.remove(commands[1])
+				permissions.remove(PLUS, commands[1])
 
-				# write pluslist to file:
-				with open("pluslist.pkl", "wb") as f:
-					pickle.dump([pluslist], f)
 
-
-			if (commands[0] == "!ban" and username in modlist):
+			if (commands[0] == "!ban" and role & MOD):
 				msg = "Banning: " + commands[1]
 				twitchBot.chat(msg)
-				banlist.append(commands[1])
-				self.socketio.emit("banlist", banlist)
-
-				# write banlist to file:
-				with open("banlist.pkl", "wb") as f:
-					pickle.dump([banlist], f)
-				
+				permissions.add(BANNED, commands[1])
 
-			if (commands[0] == "!unban" and username in modlist):
+			if (commands[0] == "!unban" and role & MOD):
 				msg = "Unbanning: " + commands[1]
 				twitchBot.chat(msg)
-				banlist.remove(commands[1])
-				self.socketio.emit("banlist", banlist)
+				permissions.remove(BANNED, commands[1])
 
-				# write banlist to file:
-				with open("banlist.pkl", "wb") as f:
-					pickle.dump([banlist], f)
-
-			if (commands[0] == "!setturnlength" and username in modlist):
+			if (commands[0] == "!setturnlength" and role & MOD):
 				msg = "Setting turn length to: " + commands[1]
 				twitchBot.chat(msg)
 				self.socketio.emit("setTurnLength", commands[1])
 
-			if (commands[0] == "!setforfeitlength" and username in modlist):
+			if (commands[0] == "!democracy" and role & MOD):
+				try:
+					window = int(commands[1])/1000
+					msg = "Democracy! The most voted input wins every " + commands[1] + "ms"
+					self.voteEngine.set_mode(VoteEngine.DEMOCRACY, window)
+				except ValueError:
+					msg = "use \"!democracy [lengthInMS]\""
+				twitchBot.chat(msg)
+
+			if (commands[0] == "!setforfeitlength" and role & MOD):
 				msg = "Setting forfeit length to: " + commands[1]
 				twitchBot.chat(msg)
 				self.socketio.emit("setForfeitLength", commands[1])
 
 
-			# if (commands[0] == "!mod" and username in adminlist):
-			# 	msg = "Modding: " + commands[1]
-			# 	twitchBot.chat(msg)
-			# 	banlist.append(commands[1])
-			# 	self.socketio.emit("banlist", banlist)
+			if (commands[0] == "!mod" and role & ADMIN):
+				msg = "Modding: " + commands[1]
+				twitchBot.chat(msg)
+				permissions.add(MOD, commands[1])
 
-			# if (commands[0] == "!unmod" and username in adminlist):
-			# 	msg = "UnModding: " + commands[1]
-			# 	twitchBot.chat(msg)
-			# 	modlist.remove(commands[1])
-			# 	self.socketio.emit("banlist", banlist)
+			if (commands[0] == "!unmod" and role & ADMIN):
+				msg = "UnModding: " + commands[1]
+				twitchBot.chat(msg)
+				permissions.remove(MOD, commands[1])
 
 		if len(commands) == 1:
 
@@ -881,13 +816,13 @@ class Client(object):
 
 			if (cmd == "!pluslist"):
 				msg = "plus list: "
-				for user in pluslist:
+				for user in permissions.names(PLUS):
 					msg += user + ","
 				twitchBot.chat(msg)
 
 			if (cmd == "!banlist"):
 				msg = "ban list: "
-				for user in banlist:
+				for user in permissions.names(BANNED):
 					msg += user + ","
 				twitchBot.chat(msg)
 
@@ -910,87 +845,81 @@ class Client(object):
 
 			if(cmd == "!restartscript"):
 				twitchBot.chat("Restarting the python script!")
-				with open("pluslist.pkl", "wb") as f:
-					pickle.dump([pluslist], f)
 				os.system("taskkill /f /im python.exe")
 
-			if (commands[0] == "!disablegoto" and username in modlist):
+			if (commands[0] == "!disablegoto" and role & MOD):
 				msg = "Disabling !goto"
 				twitchBot.chat(msg)
 				self.voting = True
-			if (commands[0] == "!enablegoto" and username in modlist):
+			if (commands[0] == "!enablegoto" and role & MOD):
 				msg = "Enabling !goto"
 				twitchBot.chat(msg)
 				self.voting = False
 
-			if (commands[0] == "!disablechat" and username in modlist):
+			if (cmd == "!democracy" and role & MOD):
+				msg = "Democracy! The most voted input wins every " + str(int(self.voteEngine.window*1000)) + "ms"
+				twitchBot.chat(msg)
+				self.voteEngine.set_mode(VoteEngine.DEMOCRACY)
+			if (cmd == "!anarchy" and role & MOD):
+				msg = "Anarchy! Every input counts"
+				twitchBot.chat(msg)
+				self.voteEngine.set_mode(VoteEngine.ANARCHY)
+
+			if (commands[0] == "!disablechat" and role & MOD):
 				msg = "Disabling chat commands!"
 				twitchBot.chat(msg)
 				self.chatEnabled = False
-			if (commands[0] == "!enablechat" and username in modlist):
+			if (commands[0] == "!enablechat" and role & MOD):
 				msg = "Enabling chat commands!"
 				twitchBot.chat(msg)
 				self.chatEnabled = True
 
-			if(cmd == "!forcerefresh" and username in modlist):
+			if(cmd == "!forcerefresh" and role & MOD):
 				self.socketio.emit("forceRefresh")
 
-			if(cmd == "!disableinternet" and username in pluslist):
+			if(cmd == "!disableinternet" and role & PLUS):
 				msg = "Disabling internet accesss!"
 				twitchBot.chat(msg)
 				self.socketio.emit("disableInternet")
-			if(cmd == "!enableinternet" and username in pluslist):
+			if(cmd == "!enableinternet" and role & PLUS):
 				msg = "Enabling internet access!"
 				twitchBot.chat(msg)
 				self.socketio.emit("enableInternet")
 
 
-			if(cmd == "!fixcontrollers" and username in pluslist):
+			if(cmd == "!fixcontrollers" and role & PLUS):
 				twitchBot.chat("Fixing controller order!")
 				# disable lagless while we do this:
 				self.controllerEnabled = False
 				self.chatEnabled = False
 
-				# reset controller
-				controller1.reset()
 				# go home
-				controller1.home = 1
-				send_and_reset(0.1, 1)
+				press(0.1, home=1)
 				sleep(2)
 
 				# navigate to re-pair section
-				controller1.LY = STICK_MAX
-				send_and_reset(0.1, 1)
-				controller1.LX = STICK_MAX
-				send_and_reset(0.1, 1)
+				press(0.1, LY=STICK_MAX)
+				press(0.1, LX=STICK_MAX)
 				sleep(0.5)
-				controller1.LX = STICK_MAX
-				send_and_reset(0.1, 1)
+				press(0.1, LX=STICK_MAX)
 				sleep(0.5)
-				controller1.LX = STICK_MAX
-				send_and_reset(0.1, 1)
+				press(0.1, LX=STICK_MAX)
 				sleep(0.5)
-				controller1.a = 1
-				send_and_reset(0.1, 1)
+				press(0.1, a=1)
 				sleep(0.5)
 
 				sleep(3)
 
 				# press a on all controllers, in the correct order
-				controller1.a = 1
-				send_and_reset(0.1, 1)
+				press(0.1, a=1)
 				sleep(0.5)
-				controller1.a = 1
-				send_and_reset(0.1, 1, 0)
+				press(0.1, a=1)
 				sleep(2)
-				controller2.a = 1
-				send_and_reset(0.1, 1, 1)
+				press(0.1, 1, a=1)
 				sleep(2)
-				controller3.a = 1
-				send_and_reset(0.1, 1, 2)
+				press(0.1, 2, a=1)
 				sleep(2)
-				controller4.a = 1
-				send_and_reset(0.1, 1, 3)
+				press(0.1, 3, a=1)
 				sleep(2)
 				# controller3.a = 1
 				# send_and_reset3(0.1, 1)
@@ -999,21 +928,15 @@ class Client(object):
 				# send_and_reset4(0.1, 1)
 
 				# go back to the game
-				controller1.a = 1
-				send_and_reset(0.1, 1)
-				controller1.a = 1
-				send_and_reset(0.1, 1)
+				press(0.1, a=1)
+				press(0.1, a=1)
 				sleep(2)
-				controller1.b = 1
-				send_and_reset(0.1, 1)
+				press(0.1, b=1)
 				sleep(1)
-				controller1.LY = STICK_MIN
-				send_and_reset(0.1, 1)
+				press(0.1, LY=STICK_MIN)
 				sleep(2)
-				controller1.LX = STICK_MIN
-				send_and_reset(1, 1)
-				controller1.a = 1
-				send_and_reset(0.1, 1)
+				press(1, LX=STICK_MIN)
+				press(0.1, a=1)
 
 
 				# re-enable lagless
@@ -1085,8 +1008,14 @@ class Client(object):
 		if (not valid):
 			commands = []
 
+		if(len(commands) > 0):
+			self.voteEngine.submit(username, tuple(commands))
+
+	def queue_commands(self, username, commands):
+		# plus users get two commands per turn. winning votes come from user None
+		weight = 2 if permissions.has(username, PLUS) else 1
 		for cmd in commands:
-			commandQueue.append(cmd)
+			commandQueue.put(username, cmd, weight)
 
 
 
@@ -1096,603 +1025,30 @@ class Client(object):
 
 		self.end = time.clock()
 		diffInMilliSeconds = (self.end - self.start)*1000
-		if(diffInMilliSeconds > 8.33333):
+		# wait for the last command's release before starting the next one
+		if(diffInMilliSeconds > 8.33333 and not scheduler.busy(0)):
 			self.start = time.clock()
 			#controller1.send(controller1.output)
 
-			if(len(commandQueue) > 0):
-				nextCommands.append(commandQueue[0])
-				del commandQueue[0]
-
-			duration = 0
-			reset = 1
-
-			if(self.lockon == True):
-				controller1.zl = 1
-				reset = 0
-
-			if(len(nextCommands) > 0):
-				# print(nextCommands)
-				cmd = nextCommands[-1]
-				del nextCommands[-1]
-
-				if(cmd == "sssleft" or cmd == "sssl"):
-					controller1.LX = STICK_MIN
-					duration = 0.01
-					reset = 1
-				if(cmd == "sssright" or cmd == "sssr"):
-					controller1.LX = STICK_MAX
-					duration = 0.01
-					reset = 1
-				if(cmd == "sssup" or cmd == "sssu"):
-					controller1.LY = STICK_MIN
-					duration = 0.01
-					reset = 1
-				if(cmd == "sssdown" or cmd == "sssd"):
-					controller1.LY = STICK_MAX
-					duration = 0.01
-					reset = 1
-
-				if(cmd == "ssleft" or cmd == "ssl"):
-					controller1.LX = STICK_MIN
-					duration = 0.1
-					reset = 1
-				if(cmd == "ssright" or cmd == "ssr"):
-					controller1.LX = STICK_MAX
-					duration = 0.1
-					reset = 1
-				if(cmd == "ssup" or cmd == "ssu"):
-					controller1.LY = STICK_MIN
-					duration = 0.1
-					reset = 1
-				if(cmd == "ssdown" or cmd == "ssd"):
-					controller1.LY = STICK_MAX
-					duration = 0.1
-					reset = 1
-
-				if(cmd == "sleft" or cmd == "sl"):
-					controller1.LX = STICK_MIN
-					duration = 0.3
-					reset = 1
-				if(cmd == "sright" or cmd == "sr"):
-					controller1.LX = STICK_MAX
-					duration = 0.3
-					reset = 1
-				if(cmd == "sup" or cmd == "su"):
-					controller1.LY = STICK_MIN
-					duration = 0.3
-					reset = 1
-				if(cmd == "sdown" or cmd == "sd"):
-					controller1.LY = STICK_MAX
-					duration = 0.3
-					reset = 1
-
-				if(cmd == "left" or cmd == "l"):
-				# if(cmd == "left"):
-					controller1.LX = STICK_MIN
-					duration = 0.6
-					reset = 1
-				if(cmd == "right" or cmd == "r"):
-				# if(cmd == "right"):
-					controller1.LX = STICK_MAX
-					duration = 0.6
-					reset = 1
-				if(cmd == "up" or cmd == "u"):
-					controller1.LY = STICK_MIN
-					duration = 0.6
-					reset = 1
-				if(cmd == "down" or cmd == "d"):
-					controller1.LY = STICK_MAX
-					duration = 0.6
-					reset = 1
-
-				if(cmd == "hleft" or cmd == "hl"):
-					controller1.LX = STICK_MIN
-					duration = 1.5
-					reset = 1
-				if(cmd == "hright" or cmd == "hr"):
-					controller1.LX = STICK_MAX
-					duration = 1.5
-					reset = 1
-				if(cmd == "hup" or cmd == "hu"):
-					controller1.LY = STICK_MIN
-					duration = 1.5
-					reset = 1
-				if(cmd == "hdown" or cmd == "hd"):
-					controller1.LY = STICK_MAX
-					duration = 1.5
-					reset = 1
-
-				if(cmd == "hhleft"):
-					controller1.LX = STICK_MIN
-					duration = 4.0
-					reset = 1
-				if(cmd == "hhright"):
-					controller1.LX = STICK_MAX
-					duration = 4.0
-					reset = 1
-				if(cmd == "hhup"):
-					controller1.LY = STICK_MIN
-					duration = 4.0
-					reset = 1
-				if(cmd == "hhdown"):
-					controller1.LY = STICK_MAX
-					duration = 4.0
-					reset = 1
-
-				
-				if(cmd == "dleft" or cmd == "dl"):
-					controller1.dpad = DPAD_LEFT
-					duration = 0.3
-					reset = 1
-				if(cmd == "dright" or cmd == "dr"):
-					controller1.dpad = DPAD_RIGHT
-					duration = 0.3
-					reset = 1
-				if(cmd == "dup" or cmd == "du"):
-					controller1.dpad = DPAD_UP
-					duration = 0.3
-					reset = 1
-				if(cmd == "ddown" or cmd == "dd"):
-					controller1.dpad = DPAD_DOWN
-					duration = 0.3
-					reset = 1
-
-
-
-				if(cmd == "slook left" or cmd == "sll"):
-					controller1.RX = STICK_MIN
-					duration = 0.1
-					reset = 1
-				if(cmd == "slook right" or cmd == "slr"):
-					controller1.RX = STICK_MAX
-					duration = 0.1
-					reset = 1
-				if(cmd == "slook up" or cmd == "slu"):
-					controller1.RY = STICK_MIN
-					duration = 0.1
-					reset = 1
-				if(cmd == "slook down" or cmd == "sld"):
-					controller1.RY = STICK_MAX
-					duration = 0.1
-					reset = 1
-
-				if(cmd == "look left" or cmd == "ll"):
-					controller1.RX = STICK_MIN
-					duration = 0.3
-					reset = 1
-				if(cmd == "look right" or cmd == "lr"):
-					controller1.RX = STICK_MAX
-					duration = 0.3
-					reset = 1
-				if(cmd == "look up" or cmd == "lu"):
-					controller1.RY = STICK_MIN
-					duration = 0.3
-					reset = 1
-				if(cmd == "look down" or cmd == "ld"):
-					controller1.RY = STICK_MAX
-					duration = 0.3
-					reset = 1
-
-				if(cmd == "hlook left" or cmd == "hll"):
-					controller1.RX = STICK_MIN
-					duration = 0.6
-					reset = 1
-				if(cmd == "hlook right" or cmd == "hlr"):
-					controller1.RX = STICK_MAX
-					duration = 0.6
-					reset = 1
-				if(cmd == "hlook up" or cmd == "hlu"):
-					controller1.RY = STICK_MIN
-					duration = 0.6
-					reset = 1
-				if(cmd == "hlook down" or cmd == "hld"):
-					controller1.RY = STICK_MAX
-					duration = 0.6
-					reset = 1
-				
-				if(cmd == "a"):
-					controller1.a = 1
-					duration = 0.3
-					reset = 1
-				if(cmd == "ha"):
-					controller1.a = 1
-					duration = 0.5
-					reset = 1
-				if(cmd == "sb"):
-					controller1.b = 1
-					duration = 0.1
-					reset = 1
-				if(cmd == "b"):
-					controller1.b = 1
-					duration = 0.4
-					reset = 1
-				if(cmd == "hb"):
-					controller1.b = 1
-					duration = 0.5
-					reset = 1
-				if(cmd == "hhb"):
-					controller1.b = 1
-					duration = 0.8
-					reset = 1
-				if(cmd == "hhhb"):
-					controller1.b = 1
-					duration = 1.8
-					reset = 1
-				if(cmd == "x"):
-					controller1.x = 1
-					duration = 0.3
-					reset = 1
-				if(cmd == "hx"):
-					controller1.x = 1
-					duration = 0.5
-					reset = 1
-				if(cmd == "y"):
-					controller1.y = 1
-					duration = 0.3
-					reset = 1
-				if(cmd == "hy"):
-					controller1.y = 1
-					duration = 0.7
-					reset = 1
-				if(cmd == "lstick"):
-					controller1.lstick = 1
-					duration = 0.1
-					reset = 1
-				if(cmd == "rstick"):
-					controller1.rstick = 1
-					duration = 0.1
-					reset = 1
-				if(cmd == "l"):
-					controller1.l = 1
-					duration = 0.1
-					reset = 1
-				if(cmd == "r"):
-					controller1.r = 1
-					duration = 0.1
-					reset = 1
-				if(cmd == "hr"):
-					controller1.r = 1
-					duration = 1
-					reset = 1
-				if(cmd == "zl"):
-					controller1.zl = 1
-					duration = 0.1
-					reset = 1
-				if(cmd == "zr"):
-					controller1.zr = 1
-					duration = 0.1
-					reset = 1
-				if(cmd == "minus"):
-					controller1.minus = 1
-					duration = 0.1
-					reset = 1
-				if(cmd == "plus"):
-					controller1.plus = 1
-					duration = 0.1
-					reset = 1
-				if(cmd == "home"):
-					controller1.home = 1
-					duration = 0.1
-					reset = 1
-
-				if(cmd == "long jump"):
-					controller1.LY = STICK_MIN
-					duration = 0.6
-					nextCommands.insert(0, "long jump2")
-					reset = 0
-				if(cmd == "long jump2"):
-					controller1.LY = STICK_MIN
-					controller1.zl = 1
-					duration = 0.01
-					nextCommands.insert(0, "long jump3")
-					reset = 0
-				if(cmd == "long jump3"):
-					controller1.LY = STICK_MIN
-					controller1.b = 1
-					duration = 0.1
-					nextCommands.insert(0, "long jump4")
-					reset = 0
-				if(cmd == "long jump4"):
-					controller1.LY = STICK_MIN
-					controller1.b = 1
-					controller1.zl = 0
-					duration = 1
-					reset = 1
-
-				if(cmd == "jump forward"):
-					controller1.LY = STICK_MIN
-					duration = 0.3
-					nextCommands.insert(0, "jump forward2")
-					reset = 0
-				if(cmd == "jump forward2"):
-					controller1.LY = STICK_MIN
-					controller1.b = 1
-					duration = 0.4
-					reset = 1
-
-				if(cmd == "jump back"):
-					controller1.LY = STICK_MAX
-					duration = 0.3
-					nextCommands.insert(0, "jump forward2")
-					reset = 0
-				if(cmd == "jump back2"):
-					controller1.LY = STICK_MAX
-					controller1.b = 1
-					duration = 0.4
-					reset = 1
-
-				if(cmd == "cap bounce"):
-					# b, y, sdive, hy, y, sdive
-					nextCommands.insert(0, "b")
-					nextCommands.insert(0, "y")
-					nextCommands.insert(0, "sdive")
-					nextCommands.insert(0, "hy")
-					nextCommands.insert(0, "y")
-					nextCommands.insert(0, "sdive")
-
-				if(cmd == "swim"):
-					# b, b, b, b
-					nextCommands.insert(0, "b")
-					nextCommands.insert(0, "b")
-					nextCommands.insert(0, "b")
-					nextCommands.insert(0, "b")
-
-
-				if(cmd == "sdive"):
-					controller1.zl = 1
-					duration = 0.1
-					nextCommands.insert(0, "sdive2")
-					reset = 0
-				if(cmd == "sdive2"):
-					controller1.y = 1
-					duration = 0.1
-					reset = 1
-
-				if(cmd == "dive"):
-					controller1.b = 1
-					duration = 0.1
-					nextCommands.insert(0, "dive2")
-					reset = 0
-				if(cmd == "dive2"):
-					controller1.zl = 1
-					duration = 0.01
-					nextCommands.insert(0, "dive3")
-					reset = 0
-				if(cmd == "dive3"):
-					controller1.y = 1
-					duration = 0.1
-					reset = 1
-
-				if(cmd == "hdive"):
-					controller1.b = 1
-					duration = 0.2
-					nextCommands.insert(0, "hdive2")
-					reset = 0
-				if(cmd == "hdive2"):
-					controller1.zl = 1
-					duration = 0.01
-					nextCommands.insert(0, "hdive3")
-					reset = 0
-				if(cmd == "hdive3"):
-					controller1.y = 1
-					duration = 0.1
-					reset = 1
-
-				if(cmd == "roll"):
-					controller1.zl = 1
-					duration = 0.01
-					nextCommands.insert(0, "roll2")
-					reset = 0
-				if(cmd == "roll2"):
-					controller1.y = 1
-					duration = 0.1
-					reset = 1
-
-				if(cmd == "backflip" or cmd == "bf" or cmd == "back flip"):
-					controller1.zl = 1
-					duration = 0.01
-					nextCommands.insert(0, "backflip2")
-					reset = 0
-				if(cmd == "backflip2"):
-					controller1.b = 1
-					duration = 0.1
-					reset = 1
-
-				if(cmd == "ground pound" or cmd == "gp" or cmd == "groundpound"):
-					controller1.b = 1
-					duration = 0.01
-					nextCommands.insert(0, "ground pound2")
-					reset = 0
-				if(cmd == "ground pound2"):
-					controller1.zl = 1
-					duration = 0.1
-					reset = 1
-
-
-
-				if(cmd == "sprint"):
-					controller1.LY = STICK_MIN
-					controller1.b = 1
-					duration = 0.6
-					reset = 1
-				if(cmd == "hsprint"):
-					controller1.LY = STICK_MIN
-					controller1.b = 1
-					duration = 1.5
-					reset = 1
-				if(cmd == "hhsprint"):
-					controller1.LY = STICK_MIN
-					controller1.b = 1
-					duration = 3
-					reset = 1
-
-
-
+			if(len(self.frames) == 0):
+				# commands from the website go first
+				if(len(nextCommands) > 0):
+					cmd = nextCommands.popleft()
+				else:
+					cmd = commandQueue.get()
+				if(cmd is not None):
+					self.frames.extend(commandTable.get(cmd))
 
-				d = 0.001
-
-				if(cmd == "spin"):
-					controller1.LX = STICK_CENTER
-					controller1.LY = STICK_MIN
-					duration = d
-					nextCommands.insert(0, "spin2")
-					reset = 0
-				if(cmd == "spin2"):
-					controller1.LX = STICK_MAX
-					controller1.LY = STICK_MIN
-					duration = d
-					nextCommands.insert(0, "spin3")
-					reset = 0
-				if(cmd == "spin3"):
-					controller1.LX = STICK_MAX
-					controller1.LY = STICK_CENTER
-					duration = d
-					nextCommands.insert(0, "spin4")
-					reset = 0
-				if(cmd == "spin4"):
-					controller1.LX = STICK_CENTER
-					controller1.LY = STICK_MAX
-					duration = d
-					nextCommands.insert(0, "spin5")
-					reset = 0
-				if(cmd == "spin5"):
-					controller1.LX = STICK_MIN
-					controller1.LY = STICK_MAX
-					duration = d
-					nextCommands.insert(0, "spin6")
-					reset = 0
-				if(cmd == "spin6"):
-					controller1.LX = STICK_MIN
-					controller1.LY = STICK_CENTER
-					duration = d
-					nextCommands.insert(0, "spin7")
-					reset = 0
-				if(cmd == "spin7"):
-					controller1.LX = STICK_MIN
-					controller1.LY = STICK_MIN
-					duration = d
-					nextCommands.insert(0, "spin8")
-					reset = 0
-				if(cmd == "spin8"):
-					controller1.LX = STICK_CENTER
-					controller1.LY = STICK_MIN
-					duration = d
-					nextCommands.insert(0, "spin9")
-					reset = 0
-				if(cmd == "spin9"):
-					controller1.LX = STICK_CENTER
-					controller1.LY = STICK_MIN
-					duration = d
-					nextCommands.insert(0, "spin10")
-					reset = 0
-				if(cmd == "spin10"):
-					controller1.LX = STICK_MAX
-					controller1.LY = STICK_MIN
-					duration = d
-					nextCommands.insert(0, "spin11")
-					reset = 0
-				if(cmd == "spin11"):
-					controller1.LX = STICK_MAX
-					controller1.LY = STICK_CENTER
-					duration = d
-					nextCommands.insert(0, "spin12")
-					reset = 0
-				if(cmd == "spin12"):
-					controller1.LX = STICK_CENTER
-					controller1.LY = STICK_MAX
-					duration = d
-					nextCommands.insert(0, "spin13")
-					reset = 0
-				if(cmd == "spin13"):
-					controller1.LX = STICK_MIN
-					controller1.LY = STICK_MAX
-					duration = d
-					nextCommands.insert(0, "spin14")
-					reset = 0
-				if(cmd == "spin14"):
-					controller1.LX = STICK_MIN
-					controller1.LY = STICK_CENTER
-					duration = d
-					nextCommands.insert(0, "spin15")
-					reset = 0
-				if(cmd == "spin15"):
-					controller1.LX = STICK_MIN
-					controller1.LY = STICK_MIN
-					duration = d
-					nextCommands.insert(0, "spin16")
-					reset = 0
-				if(cmd == "spin16"):
-					controller1.LX = STICK_CENTER
-					controller1.LY = STICK_MIN
-					duration = d
-					#nextCommands.insert(0, "spin6")
+			if(len(self.frames) > 0):
+				frame = self.frames.popleft()
+				send_frame(frame.lockon if self.lockon else frame.output, frame.duration, frame.reset)
+			else:
+				with scheduler.lock:
 					reset = 1
-
-
-				if("+" in cmd):
-					btns = [x.strip() for x in cmd.split("+")]
-
-					for btn in btns:
-						duration = 0.3
-						reset = 1
-
-						if("s" in btn):
-							duration = 0.01
-						if("h" in btn):
-							duration = 0.6
-						if("hh" in btn):
-							duration = 1.5
-						if("hhh" in btn):
-							duration = 5
-
-						btn = btn.replace("s","")
-						btn = btn.replace("h","")
-
-						if(btn == "left"):
-							controller1.LX = STICK_MIN
-						if(btn == "rigt"):
-							controller1.LX = STICK_MAX
-						if(btn == "up"):
-							controller1.LY = STICK_MIN
-						if(btn == "down"):
-							controller1.LY = STICK_MAX
-						if(btn == "dleft"):
-							controller1.dpad = DPAD_LEFT
-						if(btn == "drigt"):
-							controller1.dpad = DPAD_RIGHT
-						if(btn == "dup"):
-							controller1.dpad = DPAD_UP
-						if(btn == "ddown"):
-							controller1.dpad = DPAD_DOWN
-						
-						if(btn == "look left"):
-							controller1.RX = STICK_MIN
-						if(btn == "look rigt"):
-							controller1.RX = STICK_MAX
-						if(btn == "look up"):
-							controller1.RY = STICK_MIN
-						if(btn == "look down"):
-							controller1.RY = STICK_MAX
-						if(btn == "a"):
-							controller1.a = 1
-						if(btn == "b"):
-							controller1.b = 1
-						if(btn == "x"):
-							controller1.x = 1
-						if(btn == "y"):
-							controller1.y = 1
-						if(btn == "l"):
-							controller1.l = 1
-						if(btn == "r"):
-							controller1.r = 1
-						if(btn == "zl"):
-							controller1.zl = 1
-						if(btn == "zr"):
-							controller1.zr = 1
-						if(btn == "minus"):
-							controller1.minus = 1
-				send_and_reset(duration, reset)
+					if(self.lockon == True):
+						controller1.zl = 1
+						reset = 0
+					send_and_reset(0, reset)
 
 
 
@@ -1705,26 +1061,17 @@ class Client(object):
 		if(diffInMilliSeconds > 1000*60*5):
 			self.botstart = time.clock()
 
-			self.socketio.emit("joinSecure", {"room": "controller", "password": ROOM_SECRET})
-			self.socketio.emit("banlist", banlist)
-			self.socketio.emit("modlist", modlist)
-			self.socketio.emit("pluslist", pluslist)
-			self.socketio.emit("sublist", sublist)
+			print(commandQueue.stats())
+			print(controllerStates.stats())
 			
 			msg = "Join the discord server! https://discord.gg/ARTbddH\
 			hate the stream delay? go here! https://twitchplaysnintendoswitch.com"
 			twitchBot.chat(msg)
 
-		self.controllerEnd = time.clock()
-		diffInMilliSeconds2 = (self.controllerEnd - self.controllerStart)*1000
-		if(diffInMilliSeconds2 > 6000):
-			self.controllerStart = time.clock()
-
-			self.socketio.emit("joinSecure", {"room": "controller", "password": ROOM_SECRET})
-			self.socketio.emit("banlist", banlist)
-			self.socketio.emit("modlist", modlist)
-			self.socketio.emit("pluslist", pluslist)
-			self.socketio.emit("sublist", sublist)
+		# send any lists which changed
+		for role in permissions.changed():
+			if(role in listEvents):
+				self.socketio.emit(listEvents[role], permissions.names(role))
 
 
 		# get modlist:
@@ -1733,22 +1080,27 @@ class Client(object):
 		# 	print(data)
 
 
-		response = twitchBot.stayConnected()
-		if(response != "none"):
+		for msg in twitchBot.receive():
+			if(msg.command != "PRIVMSG"):
+				continue
 			# prevent crash
 			try:
-				username = re.search(r"\w+", response).group(0) # return the entire match
-				username = username.lower()
-				message = CHAT_MSG.sub("", response)
-				message = message.strip()
-				message = message.lower()
+				username = msg.nick.lower()
+				message = msg.text.strip().lower()
 				self.handleChat(username, message)
 			except:
 				pass
 
+		self.voteEngine.tick()
 		self.decreaseQueue()
 
+	def wait(self):
+		# sleep until chat arrives or the next controller tick is due
+		timeout = self.start + 0.00833333 - time.clock()
+		if(timeout > 0):
+			twitchBot.wait(timeout)
+
 client = Client()
 while True:
 	client.loop()
-	sleep(0.0001)
\ No newline at end of file
+	client.wait()
\ No newline at end of file
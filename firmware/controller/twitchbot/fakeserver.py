@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# fake twitch chat server, for testing without connecting to twitch
+#
+# set HOST = "localhost" and PORT = 6667 in twitchbot/config.py, then:
+#   python -m twitchbot.fakeserver --rate 50
+# lines typed on stdin are sent as chat from "tester". messages the bot
+# sends are printed with the time since the previous one, to check the
+# rate limiting.
+import argparse
+import asyncio
+import random
+import sys
+import time
+
+COMMANDS = ["a", "b", "x", "y", "up", "down", "left", "right", "hup", "sleft", "long jump", "hb+left", "dive"]
+
+class FakeServer():
+
+	def __init__(self, rate=0, ping=60, drop=0):
+		self.rate = rate
+		self.ping = ping
+		self.drop = drop
+		self.clients = []
+		self.channel = "#fake"
+		self.last = time.monotonic()
+
+	def privmsg(self, user, text):
+		return ":{0}!{0}@{0}.tmi.twitch.tv PRIVMSG {1} :{2}\r\n".format(user, self.channel, text).encode("utf-8")
+
+	def broadcast(self, data):
+		for writer in self.clients:
+			writer.write(data)
+
+	async def handle(self, reader, writer):
+		print("client connected")
+		self.clients.append(writer)
+		dropper = asyncio.ensure_future(self.drop_later(writer))
+		try:
+			while True:
+				line = await reader.readline()
+				if(not line):
+					break
+				line = line.decode("utf-8").rstrip("\r\n")
+				command, _, rest = line.partition(" ")
+				if(command == "NICK"):
+					writer.write(":tmi.twitch.tv 001 {} :Welcome, GLHF!\r\n".format(rest).encode("utf-8"))
+				elif(command == "JOIN"):
+					self.channel = rest
+				elif(command == "PRIVMSG"):
+					now = time.monotonic()
+					print("{:7.3f}s bot: {}".format(now - self.last, rest.partition(" :")[2]))
+					self.last = now
+				elif(command == "PONG"):
+					print("pong")
+		except ConnectionError:
+			pass
+		finally:
+			dropper.cancel()
+			self.clients.remove(writer)
+			writer.close()
+			print("client disconnected")
+
+	async def drop_later(self, writer):
+		# close the connection after a while, to test reconnecting
+		if(self.drop > 0):
+			await asyncio.sleep(self.drop)
+			writer.close()
+
+	async def pinger(self):
+		while True:
+			await asyncio.sleep(self.ping)
+			self.broadcast(b"PING :tmi.twitch.tv\r\n")
+
+	async def flood(self):
+		# random commands from random users, rate lines a second
+		n = 0
+		start = time.monotonic()
+		while True:
+			n += 1
+			delay = start + n/self.rate - time.monotonic()
+			if(delay > 0):
+				await asyncio.sleep(delay)
+			self.broadcast(self.privmsg("user{}".format(random.randrange(1000)), random.choice(COMMANDS)))
+
+	def stdin_line(self):
+		line = sys.stdin.readline().strip()
+		if(line):
+			self.broadcast(self.privmsg("tester", line))
+
+def main():
+	parser = argparse.ArgumentParser(description="Fake twitch chat server.")
+	parser.add_argument("--port", type=int, default=6667)
+	parser.add_argument("--rate", type=float, default=0, help="random chat commands per second")
+	parser.add_argument("--ping", type=float, default=60, help="seconds between PINGs")
+	parser.add_argument("--drop", type=float, default=0, help="close each connection after this many seconds")
+	args = parser.parse_args()
+
+	server = FakeServer(args.rate, args.ping, args.drop)
+	loop = asyncio.get_event_loop()
+	loop.run_until_complete(asyncio.start_server(server.handle, "localhost", args.port))
+	asyncio.ensure_future(server.pinger())
+	if(args.rate > 0):
+		asyncio.ensure_future(server.flood())
+	if(sys.platform != "win32" and sys.stdin.isatty()):
+		loop.add_reader(sys.stdin, server.stdin_line)
+	print("listening on localhost:{}".format(args.port))
+	loop.run_forever()
+
+if __name__ == "__main__":
+	main()
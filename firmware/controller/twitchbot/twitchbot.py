@@ -1,57 +1,164 @@
 # bot.py
 # http://www.instructables.com/id/Twitchtv-Moderator-Bot/
-import socket
+import asyncio
+import threading
+import time
 from time import sleep
+from collections import deque
 import re
 from .config import *
 import requests
 
 CHAT_MSG=re.compile(r"^:\w+!\w+@\w+\.tmi\.twitch\.tv PRIVMSG #\w+ :")
 
+TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+def unescape_tag(value):
+	if("\\" not in value):
+		return value
+	out = []
+	chars = iter(value)
+	for c in chars:
+		if(c == "\\"):
+			c = next(chars, "")
+			out.append(TAG_ESCAPES.get(c, c))
+		else:
+			out.append(c)
+	return "".join(out)
+
+class Message():
+	"""
+	One IRC line, split into its parts:
+	tags    -- dict of IRCv3 tags, eg {"display-name": "Foo", "mod": "1"}
+	prefix  -- "nick!user@host", or "" if there isn't one
+	command -- eg "PRIVMSG" or "PING"
+	params  -- list of parameters, the last one may contain spaces
+	raw     -- the whole line, without the \\r\\n
+	"""
+
+	__slots__ = ["tags", "prefix", "command", "params", "raw"]
+
+	def __init__(self, raw):
+		self.raw = raw
+		self.tags = {}
+		self.prefix = ""
+
+		rest = raw
+		if(rest.startswith("@")):
+			tags, _, rest = rest[1:].partition(" ")
+			for tag in tags.split(";"):
+				key, _, value = tag.partition("=")
+				self.tags[key] = unescape_tag(value)
+			rest = rest.lstrip(" ")
+		if(rest.startswith(":")):
+			self.prefix, _, rest = rest[1:].partition(" ")
+			rest = rest.lstrip(" ")
+
+		rest, sep, trailing = rest.partition(" :")
+		self.params = rest.split()
+		self.command = self.params.pop(0).upper() if self.params else ""
+		if(sep):
+			self.params.append(trailing)
+
+	@property
+	def nick(self):
+		return self.prefix.partition("!")[0]
+
+	@property
+	def text(self):
+		return self.params[-1] if self.params else ""
+
+	def __repr__(self):
+		return "Message(" + repr(self.raw) + ")"
+
+class IRCParser():
+	"""
+	Splits a stream of bytes from the server into Messages. Data can be fed
+	in pieces of any size; a line which is cut off is kept until the rest
+	of it arrives.
+	"""
+
+	def __init__(self):
+		self.buffer = b""
+
+	def feed(self, data):
+		# returns a list of the complete Messages in buffer + data
+		lines = (self.buffer + data).split(b"\r\n")
+		self.buffer = lines.pop()
+		return [Message(line.decode("utf-8", "replace")) for line in lines if line]
+
+class TokenBucket():
+	"""
+	Allows rate messages a second on average, and up to burst at once.
+	"""
+
+	def __init__(self, rate, burst):
+		self.rate = rate
+		self.burst = burst
+		self.tokens = burst
+		self.time = time.monotonic()
+
+	def delay(self):
+		# takes a token and returns 0, or returns how long until there is one
+		now = time.monotonic()
+		self.tokens = min(self.burst, self.tokens + (now - self.time)*self.rate)
+		self.time = now
+		if(self.tokens >= 1):
+			self.tokens -= 1
+			return 0
+		return (1 - self.tokens)/self.rate
+
 class TwitchBot():
+	"""
+	IRC client running on its own thread with asyncio, so a slow or dropped
+	connection never holds up the controller loop. Received messages are
+	collected until receive() is called. Chat messages are queued and sent
+	no faster than the chat limits allow: 20 per 30 seconds by default, or
+	use rate=100/30, burst=100 for a moderator account.
+	"""
 	
-	def __init__(self):
-		self.sock = socket.socket()
+	def __init__(self, rate=20/30, burst=20):
 		self.CHAN = ""
 		self.PASS = ""
 		self.NICK = ""
 		self.HOST = ""
 		self.PORT = 0
 
+		self.bucket = TokenBucket(rate, burst)
+		self.outgoing = deque()
+		self.messages = deque()
+		self.ready = threading.Event()
+		self.connected = False
+
+		self.loop = asyncio.new_event_loop()
+		self.wakeup = None
+		self.thread = None
+
 	def chat(self, msg):
 		"""
-		Send a chat message to the server.
+		Queue a chat message to be sent to the channel.
 		Keyword arguments:
-		sock -- the socket over which to send the message
 		msg  -- the message to be sent
 		"""
-		#self.sock.send("PRIVMSG #{} :{}".format(CHAN, msg))
-		# full_msg = "PRIVMSG #{} :{}".format(CHAN, msg)
-
-		full_msg = "PRIVMSG " + self.CHAN + " :" + msg + "\r\n"
-		
-		msg_encoded = full_msg.encode("utf-8")
-		self.sock.send(msg_encoded)
-
+		self.outgoing.append("PRIVMSG " + self.CHAN + " :" + msg)
+		self.loop.call_soon_threadsafe(self.wake)
 
 	def ban(self, user):
 		"""
 		Ban a user from the current channel.
 		Keyword arguments:
-		sock -- the socket over which to send the ban command
 		user -- the user to be banned
 		"""
-		chat(self.sock, ".ban {}".format(user))
+		self.chat(".ban {}".format(user))
 
 	def timeout(self, user, secs=600):
 		"""
 		Time out a user for a set period of time.
 		Keyword arguments:
-		sock -- the socket over which to send the timeout command
 		user -- the user to be timed out
 		secs -- the length of the timeout in seconds (default 600)
 		"""
-		chat(self.sock, ".timeout {}".format(user, secs))
+		self.chat(".timeout {} {}".format(user, secs))
 
 	def connect(self, HOST, PASS, PORT, CHANNEL, NICK):
 		self.HOST = HOST
@@ -60,27 +167,92 @@ class TwitchBot():
 		self.NICK = NICK
 		self.PORT = PORT
 
-		self.sock.connect((self.HOST, self.PORT))
-		self.sock.send("PASS {}\r\n".format(self.PASS).encode("utf-8"))
-		self.sock.send("NICK {}\r\n".format(self.NICK).encode("utf-8"))
-		self.sock.send("JOIN {}\r\n".format(self.CHAN).encode("utf-8"))
+		self.thread = threading.Thread(target=self.run)
+		self.thread.daemon = True
+		self.thread.start()
+
+	def receive(self):
+		# returns the messages received since the last call, without blocking
+		self.ready.clear()
+		messages = []
+		while(len(self.messages) > 0):
+			messages.append(self.messages.popleft())
+		return messages
+
+	def wait(self, timeout=None):
+		# blocks until there are messages to receive, or timeout seconds
+		return self.ready.wait(timeout)
 
 	def stayConnected(self):
-		response = "none"
-		self.sock.setblocking(False)
-		# self.sock.settimeout(0.1)
-		try:
-			response = self.sock.recv(1024).decode("utf-8")
-		except:
-			pass
-		if(response == "PING :tmi.twitch.tv\r\n"):
-			self.sock.send("PONG :tmi.twitch.tv\r\n".encode("utf-8"))
-			return "none"
-		else:
-			#username = re.search(r"\w+", response).group(0) # return the entire match
-			#message = CHAT_MSG.sub("", response)
-			#print(username + ": " + message)
-			return response
+		# returns one line at a time, or "none" if there isn't one
+		if(len(self.messages) > 0):
+			return self.messages.popleft().raw
+		return "none"
+
+	def wake(self):
+		if(self.wakeup is not None):
+			self.wakeup.set()
+
+	def run(self):
+		asyncio.set_event_loop(self.loop)
+		self.loop.run_until_complete(self.main())
+
+	async def main(self):
+		self.wakeup = asyncio.Event()
+		backoff = 1
+
+		while True:
+			try:
+				reader, writer = await asyncio.open_connection(self.HOST, self.PORT)
+			except OSError as e:
+				print("twitch connect error:", e)
+				await asyncio.sleep(backoff)
+				backoff = min(backoff*2, 60)
+				continue
+
+			writer.write("PASS {}\r\nNICK {}\r\nJOIN {}\r\n".format(self.PASS, self.NICK, self.CHAN).encode("utf-8"))
+			parser = IRCParser()
+			sender = asyncio.ensure_future(self.send_queued(writer))
+			self.connected = True
+
+			try:
+				while True:
+					data = await reader.read(65536)
+					if(not data):
+						break
+					backoff = 1
+					for message in parser.feed(data):
+						if(message.command == "PING"):
+							writer.write(("PONG :" + message.text + "\r\n").encode("utf-8"))
+						else:
+							self.messages.append(message)
+					self.ready.set()
+			except OSError as e:
+				print("twitch read error:", e)
+			finally:
+				self.connected = False
+				sender.cancel()
+				writer.close()
+
+			print("twitch disconnected, reconnecting in", backoff, "seconds")
+			await asyncio.sleep(backoff)
+			backoff = min(backoff*2, 60)
+
+	async def send_queued(self, writer):
+		while True:
+			while(len(self.outgoing) == 0):
+				self.wakeup.clear()
+				await self.wakeup.wait()
+
+			delay = self.bucket.delay()
+			while(delay > 0):
+				await asyncio.sleep(delay)
+				delay = self.bucket.delay()
+
+			# only drop the message once it has been sent, so it is retried after a reconnect
+			writer.write((self.outgoing[0] + "\r\n").encode("utf-8"))
+			await writer.drain()
+			self.outgoing.popleft()
 
 	def set_title_game(self, title, game):
 		scope = "&scope=channel_editor"
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# chat voting for twitch-control.py
+#
+# in anarchy mode every chat message goes straight to the command queue. in
+# democracy mode messages are votes, and at the end of each window the input
+# with the most votes is sent. each vote costs a set lookup and a dict
+# update, however many people are voting.
+
+import time
+
+
+class VoteWindow():
+	"""
+	Votes for one window. Each user gets one vote; the first choice which
+	reaches the highest count wins ties.
+	"""
+
+	def __init__(self):
+		self.counts = {}
+		self.voters = set()
+		self.leader = None
+		self.leader_votes = 0
+
+	def __len__(self):
+		return len(self.voters)
+
+	def vote(self, user, choice):
+		# returns False if the user has already voted
+		if(user in self.voters):
+			return False
+		self.voters.add(user)
+		votes = self.counts.get(choice, 0) + 1
+		self.counts[choice] = votes
+		if(votes > self.leader_votes):
+			self.leader = choice
+			self.leader_votes = votes
+		return True
+
+	def count(self, choice):
+		return self.counts.get(choice, 0)
+
+
+class VoteEngine():
+	"""
+	Passes chat inputs to output(user, choice), either all of them (anarchy)
+	or only the most voted one every window seconds (democracy). Winners are
+	sent with user None.
+	"""
+
+	ANARCHY = "anarchy"
+	DEMOCRACY = "democracy"
+
+	def __init__(self, output, mode=ANARCHY, window=2.0):
+		self.output = output
+		self.mode = mode
+		self.window = window
+		self.votes = VoteWindow()
+		self.deadline = time.monotonic() + window
+
+	def set_mode(self, mode, window=None):
+		self.mode = mode
+		if(window is not None):
+			self.window = window
+		self.votes = VoteWindow()
+		self.deadline = time.monotonic() + self.window
+
+	def submit(self, user, choice):
+		if(self.mode == VoteEngine.DEMOCRACY):
+			self.votes.vote(user, choice)
+		else:
+			self.output(user, choice)
+
+	def tick(self):
+		# ends the current window if it is over, and sends the winner
+		if(self.mode != VoteEngine.DEMOCRACY):
+			return None
+		now = time.monotonic()
+		if(now < self.deadline):
+			return None
+
+		winner = self.votes.leader
+		self.votes = VoteWindow()
+		self.deadline = max(self.deadline + self.window, now)
+		if(winner is not None):
+			self.output(None, winner)
+		return winner
@@ -15,25 +15,35 @@
 # along with switchcon.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import time
+_import_start = time.perf_counter()
+
 import argparse
 import itertools
 import logging
+import sys
 
-import sdl2
-import sdl2.ext
-
-from tqdm import tqdm
-
-from .controller import Controller
+# Input and output backends, SDL and tqdm are imported when they are
+# needed, so a headless replay doesn't pay for loading them.
+from .merger import Merger, Rule, parse_sources
 from .state import State
 from .macromanager import MacroManager
-from .window import Window, WindowClosed
 from .hal import HAL
+from .control import Control, Quit
+from .profiles import profiles, load_profile
 from .macros import fakeinput, macros_dict
 
-class Handler(logging.Handler):
+class Handler(logging.StreamHandler):
+    def __init__(self):
+        super().__init__(sys.stdout)
+
     def emit(self, record):
-        tqdm.write(self.format(record))
+        # Write through tqdm if the progress bar is in use, so it gets redrawn.
+        tqdm = sys.modules.get('tqdm')
+        if tqdm is None:
+            super().emit(record)
+        else:
+            tqdm.tqdm.write(self.format(record))
 
 root_logger = logging.getLogger()
 root_logger.setLevel(logging.DEBUG)
@@ -47,6 +57,29 @@ def replay_states(filename):
             yield State.fromhex(line)
 
 
+def open_input(controller, calibration=None):
+    if '+' in controller or '@' in controller:
+        return Merger([
+            (open_input(source, calibration), Rule(rule))
+            for source, rule in parse_sources(controller)
+        ])
+    elif controller == 'fake':
+        return fakeinput()
+    elif controller.startswith('evdev:'):
+        from .evdevinput import EvdevController
+        source = EvdevController(controller[6:])
+    else:
+        from .controller import Controller
+        source = Controller(controller)
+
+    if calibration is not None:
+        from .calibration import load_calibration
+        tables = load_calibration(calibration, source.guid, source.name)
+        if tables is not None:
+            source.calibrate(tables)
+    return source
+
+
 class Recorder(object):
     def __init__(self, filename):
         self.filename = filename
@@ -66,18 +99,76 @@ class Recorder(object):
             self.file.write(state.hex + b'\n')
 
 
+class NullProgress(object):
+    """Stands in for tqdm when the speed meter is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def set_description(self, desc):
+        pass
+
+    def update(self, n=1):
+        pass
+
+
+class StartupProfile(object):
+    """
+    Records how long each step of startup takes, and which modules were
+    imported during it. Use python -X importtime for a
+    breakdown of individual modules.
+    """
+
+    def __init__(self, start):
+        self._prev = self._start = start
+        self._modules = set(sys.modules)
+        self._steps = []
+
+    def mark(self, step):
+        now = time.perf_counter()
+        modules = set(sys.modules)
+        # Our own modules by name, anything else by its top level package.
+        imported = sorted({m if m.startswith(__package__ + '.') else m.split('.')[0] for m in modules - self._modules})
+        self._steps.append((step, now - self._prev, imported))
+        self._prev = now
+        self._modules = modules
+
+    def report(self):
+        for step, elapsed, imported in self._steps:
+            logger.info('{:7.1f} ms  {:s}{:s}'.format(
+                1000 * elapsed, step, (' (' + ', '.join(imported) + ')') if imported else ''
+            ))
+        logger.info('{:7.1f} ms  total'.format(1000 * (self._prev - self._start)))
+
+
 def main():
+    startup = StartupProfile(_import_start)
+    startup.mark('import switchcon')
+
     parser = argparse.ArgumentParser()
     parser.add_argument('-l', '--list-controllers', action='store_true', help='Display a list of controllers attached to the system.')
-    parser.add_argument('-c', '--controller', type=str, default='0', help='Controller to use. Default: 0.')
+    parser.add_argument('-c', '--controller', type=str, nargs='+', default=['0'], help='Controller to use for each player: an SDL controller number or name, evdev:/dev/input/eventN, or fake. Join sources with + to merge them, optionally limiting each to parts of the controller, e.g. 0@sticks,hat+1@buttons. More than one needs a functionfs composite gadget. Default: 0.')
+    parser.add_argument('-C', '--calibration', type=str, default=None, help='JSON file of stick deadzones and response curves per controller GUID or name. Default: None.')
     parser.add_argument('-m', '--macro-controller', metavar='CONTROLLER:RECORD_BUTTON:PLAY_BUTTON', type=str, default=None, help='Controller and buttons to use for macro control. Default: None.')
-    parser.add_argument('-p', '--port', type=str, default='/dev/ttyUSB0', help='Serial port or "functionfs" for direct USB mode. Default: /dev/ttyUSB0.')
+    parser.add_argument('-p', '--port', type=str, default='/dev/ttyUSB0', help='Serial port, "functionfs" for direct USB mode, or "pipe" for a simulated USB host. Default: /dev/ttyUSB0.')
     parser.add_argument('-b', '--baud-rate', type=int, default=115200, help='Baud rate. Default: 115200.')
     parser.add_argument('-u', '--udc', type=str, default='dummy_udc.0', help='UDC for direct USB mode. Default: dummy_udc.0 (loopback mode).')
+    parser.add_argument('-r', '--profile', type=str, default='horipad', help='USB device profile: {:s}, or a JSON file. Default: horipad.'.format(', '.join(profiles)))
+    parser.add_argument('--changes-only', action='store_true', help='Serial only: send a state only when it changes, and let the Arduino repeat it. Default: False.')
+    parser.add_argument('--keepalive', type=float, default=1.0, help='With --changes-only, resend the state after this many seconds without changes. Default: 1.0.')
+    parser.add_argument('--measure-poll-rate', action='store_true', help='Periodically log the rate at which the host collects reports. Default: False.')
+    parser.add_argument('-A', '--attach', action='store_true', help='Reuse an existing functionfs gadget and leave it bound on exit, so restarts do not disconnect from the console. Default: False.')
     parser.add_argument('-R', '--record', type=str, default=None, help='Record events to file.')
     parser.add_argument('-P', '--playback', type=str, default=None, help='Play back events from file.')
     parser.add_argument('-d', '--dontexit', action='store_true', help='Switch to live input when playback finishes, instead of exiting. Default: False.')
     parser.add_argument('-q', '--quiet', action='store_true', help='Disable speed meter. Default: False.')
+    parser.add_argument('-W', '--no-window', action='store_true', help='Do not open the preview window. Default: False.')
+    parser.add_argument('-H', '--headless', action='store_true', help='Run without a window or speed meter, for use as a service. Default: False.')
+    parser.add_argument('--control', type=str, default=None, help='Unix socket to accept commands on: record, play, macro NAME, file PATH, status, quit. Default: None.')
+    parser.add_argument('--startup-profile', action='store_true', help='Log how long each step of startup took. Default: False.')
     parser.add_argument('-M', '--macros-dir', type=str, default='.', help='Directory to save macros. Default: current directory.')
     parser.add_argument('-f', '--function', type=str, nargs='*', default=[], help='Map a macro function to a button.')
     parser.add_argument('-D', '--log-level', type=str, default='INFO', help='Debugging level. CRITICAL, ERROR, WARNING, INFO, DEBUG. Default=INFO')
@@ -89,25 +180,52 @@ def main():
         raise ValueError('Invalid log level: %s' % args.log_level)
     root_logger.setLevel(numeric_level)
 
+    if args.headless:
+        args.no_window = True
+        args.quiet = True
+
     if args.list_controllers:
+        from .controller import Controller
         Controller.enumerate()
         exit(0)
 
+    startup.mark('parse arguments')
+
+    try:
+        profile = load_profile(args.profile)
+    except (OSError, ValueError) as e:
+        logger.critical('Could not load profile {:s}: {:s}'.format(args.profile, str(e)))
+        exit(-1)
+
+    startup.mark('load profile')
+
     states = []
+    player_one = None
 
     if args.playback is None or args.dontexit:
-        if args.controller == 'fake':
-            states = fakeinput()
-        else:
-            states = Controller(args.controller)
+        states = player_one = open_input(args.controller[0], args.calibration)
     if args.playback is not None:
         states = itertools.chain(replay_states(args.playback), states)
 
+    # Macros, recording and playback only apply to player 1.
+    inputs = [player_one] + [open_input(c, args.calibration) for c in args.controller[1:]]
+
+    # SDL controllers are kept up to date from the SDL event queue.
+    controllers = [c for i in inputs for c in getattr(i, 'sources', [i]) if hasattr(c, 'handle_event')]
+
+    startup.mark('open inputs')
+
     macro_controller = None
     macro_record = None
     macro_play = None
 
+    sdl2 = None
+    if controllers or args.macro_controller is not None or not args.no_window:
+        import sdl2
+        import sdl2.ext
+
     if args.macro_controller is not None:
+        sdl2.SDL_Init(sdl2.SDL_INIT_JOYSTICK)
         try:
             macro_controller, macro_record, macro_play = args.macro_controller.rsplit(':', maxsplit=3)
             macro_record = int(macro_record, 10)
@@ -131,11 +249,20 @@ def main():
                         macro_controller = n
 
     window = None
-    try:
-        window = Window()
-    except sdl2.ext.common.SDLError:
-        logger.warning('Could not create a window with SDL. Keyboard input will not be available.')
-        pass
+    WindowClosed = ()  # an empty tuple catches nothing when there is no window
+    if not args.no_window:
+        from .window import Window, WindowClosed
+        try:
+            window = Window(players=len(args.controller))
+        except sdl2.ext.common.SDLError:
+            logger.warning('Could not create a window with SDL. Keyboard input will not be available.')
+            pass
+
+    if window is None and not controllers and args.macro_controller is None:
+        # Nothing needs SDL events, so don't poll for them.
+        sdl2 = None
+
+    startup.mark('create window')
 
     function_macros = {}
     for arg in args.function:
@@ -147,51 +274,83 @@ def main():
         except KeyError:
             logger.error('Invalid function macro ignored.')
 
-    with MacroManager(states, macros_dir=args.macros_dir, record_button=macro_record, play_button=macro_play, function_macros=function_macros) as mm:
-        with Recorder(args.record) as record:
-            with HAL(args.port, args.baud_rate, args.udc) as hal:
-                with tqdm(unit=' updates', disable=args.quiet, dynamic_ncols=True) as pbar:
-
-                    try:
-
-                        while True:
-
-                            for event in sdl2.ext.get_events():
-                                # we have to fetch the events from SDL in order for the controller
-                                # state to be updated.
-                                if event.type == sdl2.SDL_WINDOWEVENT:
-                                    if event.window.event == sdl2.SDL_WINDOWEVENT_CLOSE:
-                                        raise WindowClosed
-                                else:
-                                    if event.type == sdl2.SDL_KEYDOWN and event.key.repeat == 0:
-                                        logger.debug('Key down: {:s}'.format(sdl2.SDL_GetKeyName(event.key.keysym.sym).decode('utf8')))
-                                        mm.key_event(event.key.keysym.sym, True)
-                                    elif event.type == sdl2.SDL_KEYUP:
-                                        logger.debug('Key up: {:s}'.format(sdl2.SDL_GetKeyName(event.key.keysym.sym).decode('utf8')))
-                                        mm.key_event(event.key.keysym.sym, False)
-                                    elif event.jdevice.which == macro_controller:
-                                        if event.type == sdl2.SDL_JOYBUTTONDOWN:
-                                            logger.debug('Macro controller button down: {:d}'.format(event.jbutton.button))
-                                            mm.button_event(event.jbutton.button, True)
-                                        elif event.type == sdl2.SDL_JOYBUTTONUP:
-                                            mm.button_event(event.jbutton.button, False)
-
-                            # wait for the arduino to request another state.
-                            if hal.poll():
-                                state = next(mm)
-                                hal.write(state)
-                                record.write(state)
-                                pbar.set_description('Sent {:s}'.format(state.hexstr))
-                                pbar.update()
+    if args.quiet:
+        progress = NullProgress()
+    else:
+        from tqdm import tqdm
+        progress = tqdm(unit=' updates', dynamic_ncols=True)
+
+    with Control(args.control) as control:
+        with MacroManager(states, macros_dir=args.macros_dir, record_button=macro_record, play_button=macro_play, function_macros=function_macros) as mm:
+            control.attach(mm)
+            with Recorder(args.record) as record:
+                with HAL(args.port, args.baud_rate, args.udc, attach=args.attach, profile=profile, measure=args.measure_poll_rate, players=len(args.controller), changes_only=args.changes_only, keepalive=args.keepalive) as hal:
+                    with progress as pbar:
+
+                        startup.mark('open output')
+                        if args.startup_profile:
+                            startup.report()
+
+                        try:
+
+                            while True:
+
+                                if control.pending:
+                                    control.run_commands()
+
+                                for event in (sdl2.ext.get_events() if sdl2 is not None else ()):
+                                    # controllers keep their state up to date from these events.
+                                    for controller in controllers:
+                                        controller.handle_event(event)
+                                    if event.type == sdl2.SDL_WINDOWEVENT:
+                                        if event.window.event == sdl2.SDL_WINDOWEVENT_CLOSE:
+                                            raise WindowClosed
+                                    else:
+                                        if event.type == sdl2.SDL_KEYDOWN and event.key.repeat == 0:
+                                            logger.debug('Key down: {:s}'.format(sdl2.SDL_GetKeyName(event.key.keysym.sym).decode('utf8')))
+                                            mm.key_event(event.key.keysym.sym, True)
+                                        elif event.type == sdl2.SDL_KEYUP:
+                                            logger.debug('Key up: {:s}'.format(sdl2.SDL_GetKeyName(event.key.keysym.sym).decode('utf8')))
+                                            mm.key_event(event.key.keysym.sym, False)
+                                        elif event.jdevice.which == macro_controller:
+                                            if event.type == sdl2.SDL_JOYBUTTONDOWN:
+                                                logger.debug('Macro controller button down: {:d}'.format(event.jbutton.button))
+                                                mm.button_event(event.jbutton.button, True)
+                                            elif event.type == sdl2.SDL_JOYBUTTONUP:
+                                                mm.button_event(event.jbutton.button, False)
+
+                                # wait for the arduino or the host to request another state.
+                                for player in hal.poll():
+                                    if player == 0:
+                                        state = next(mm)
+                                        hal.write(state)
+                                        record.write(state)
+                                        pbar.set_description('Sent {:s}'.format(state.hexstr))
+                                        if window is not None:
+                                            window.update(state)
+                                    else:
+                                        state = next(inputs[player])
+                                        hal.write(state, player)
+                                        if window is not None:
+                                            window.update(state, player)
+                                    pbar.update()
+
+                                # the preview is drawn on its own thread; this just shows a finished frame.
                                 if window is not None:
-                                    window.update(state)
-
-                    except StopIteration:
-                        logger.info('Exiting because replay finished.')
-                    except KeyboardInterrupt:
-                        logger.info('Exiting due to keyboard interrupt.')
-                    except WindowClosed:
-                        logger.info('Exiting because input window was closed.')
+                                    window.present()
+
+                        except StopIteration:
+                            logger.info('Exiting because replay finished.')
+                        except KeyboardInterrupt:
+                            logger.info('Exiting due to keyboard interrupt.')
+                        except Quit as e:
+                            logger.info('Exiting on request ({:s}).'.format(str(e)))
+                        except WindowClosed:
+                            logger.info('Exiting because input window was closed.')
+
+                        if window is not None:
+                            window.close()
+                            logger.info('Preview drew {:d} frames, {:d} states were not shown.'.format(window.frames, window.dropped))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,148 @@
+# This file is part of switchcon
+# Copyright (C) 2018  Alistair Buxton <a.j.buxton@gmail.com>
+#
+# switchcon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# switchcon is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with switchcon.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import array
+import hashlib
+import json
+import logging
+import math
+import os
+
+logger = logging.getLogger(__name__)
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'switchcon')
+
+
+class Calibration(object):
+    """
+    Deadzone and response settings for one stick.
+
+    deadzone: radius around the centre which reads as neutral, 0 to 1.
+    outer:    width of the ring at the edge which reads as full deflection, 0 to 1.
+    curve:    exponent applied to the distance from the centre. 1 is linear.
+    invert_x, invert_y: flip an axis.
+
+    The settings are compiled into a table indexed by the 8 bit x and y
+    position, x << 8 | y, where each entry is the output position packed
+    the same way. Building the table is slow on small machines, so it is
+    cached on disk.
+    """
+
+    def __init__(self, deadzone=0.0, outer=0.0, curve=1.0, invert_x=False, invert_y=False):
+        if deadzone + outer >= 1:
+            raise ValueError('deadzone and outer must add up to less than 1.')
+        self.deadzone = deadzone
+        self.outer = outer
+        self.curve = curve
+        self.invert_x = invert_x
+        self.invert_y = invert_y
+
+    @property
+    def params(self):
+        return {
+            'deadzone': self.deadzone,
+            'outer': self.outer,
+            'curve': self.curve,
+            'invert_x': self.invert_x,
+            'invert_y': self.invert_y,
+        }
+
+    @property
+    def digest(self):
+        return hashlib.sha1(json.dumps(self.params, sort_keys=True).encode('utf8')).hexdigest()[:16]
+
+    @staticmethod
+    def to_unit(v):
+        return max(-1.0, (v - 128) / 127)
+
+    @staticmethod
+    def from_unit(v):
+        return min(255, max(0, 128 + round(v * (128 if v < 0 else 127))))
+
+    def build(self):
+        table = array.array('H', bytes(2 * 65536))
+        live = 1 - self.deadzone - self.outer
+        sx = -1 if self.invert_x else 1
+        sy = -1 if self.invert_y else 1
+
+        for x in range(256):
+            fx = Calibration.to_unit(x)
+            for y in range(256):
+                fy = Calibration.to_unit(y)
+                r = math.hypot(fx, fy)
+                if r <= self.deadzone:
+                    ox = oy = 128
+                else:
+                    scale = (min(1.0, (r - self.deadzone) / live) ** self.curve) / r
+                    ox = Calibration.from_unit(sx * fx * scale)
+                    oy = Calibration.from_unit(sy * fy * scale)
+                table[x << 8 | y] = ox << 8 | oy
+
+        return table
+
+    def table(self, guid=None, cache_dir=CACHE_DIR):
+        """Returns the compiled table, from the cache if possible."""
+        filename = os.path.join(cache_dir, '{:s}-{:s}.lut'.format(guid or 'default', self.digest))
+
+        try:
+            with open(filename, 'rb') as f:
+                table = array.array('H')
+                table.frombytes(f.read())
+            if len(table) == 65536:
+                return table
+        except OSError:
+            pass
+
+        logger.info('Building calibration table for {:s}.'.format(guid or 'default'))
+        table = self.build()
+
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(filename, 'wb') as f:
+                f.write(table.tobytes())
+        except OSError as e:
+            logger.warning('Could not cache calibration table: {:s}'.format(str(e)))
+
+        return table
+
+
+def load_calibration(filename, guid=None, name=None, cache_dir=CACHE_DIR):
+    """
+    Returns (left, right) tables for a controller from a JSON file. The
+    file maps controller GUIDs or names to settings, with "default" used
+    for controllers which are not listed. Settings apply to both sticks,
+    and can be overridden per stick with "left" and "right" objects:
+
+        {"default": {"deadzone": 0.15},
+         "030000005e0400008e02000010010000": {"curve": 1.5, "right": {"invert_y": true}}}
+
+    Returns None if nothing in the file applies.
+    """
+    with open(filename, 'r') as f:
+        data = json.load(f)
+
+    settings = data.get(guid) or data.get(name) or data.get('default')
+    if settings is None:
+        return None
+
+    common = {k: v for k, v in settings.items() if k not in ('left', 'right')}
+    tables = []
+    for stick in ('left', 'right'):
+        calibration = Calibration(**dict(common, **settings.get(stick, {})))
+        tables.append(calibration.table(guid, cache_dir))
+    return tuple(tables)
@@ -0,0 +1,147 @@
+# This file is part of switchcon
+# Copyright (C) 2018  Alistair Buxton <a.j.buxton@gmail.com>
+#
+# switchcon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# switchcon is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with switchcon.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import logging
+import os
+import pathlib
+import signal
+import socket
+import threading
+
+from .macros import macros_dict
+
+logger = logging.getLogger(__name__)
+
+
+class Quit(Exception):
+    pass
+
+
+class Control(object):
+    """
+    Remote control for running without a window. Commands come from
+    signals or from lines written to a unix socket:
+
+        record        start or stop recording a macro (SIGUSR1)
+        play          play the macro for the current state (SIGUSR2)
+        macro NAME    start or stop a built-in macro function
+        file PATH     start or stop playing a macro file
+        status        reply with what is recording and playing
+        quit          exit cleanly
+
+    SIGTERM and SIGHUP exit immediately, the same way as Ctrl-C.
+
+    Commands are queued and run by the main loop from run_commands(),
+    which costs nothing while the queue is empty.
+    """
+
+    commands = {'record', 'play', 'macro', 'file', 'status', 'quit'}
+
+    def __init__(self, path=None):
+        self._path = path
+        self._socket = None
+        self._thread = None
+        self._mm = None
+        self.pending = collections.deque()
+
+    def __enter__(self):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.pending.append(('record', None)))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self.pending.append(('play', None)))
+        signal.signal(signal.SIGTERM, self.quit_now)
+        signal.signal(signal.SIGHUP, self.quit_now)
+
+        if self._path is not None:
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.bind(self._path)
+            self._socket.listen(1)
+            self._thread = threading.Thread(target=self.serve, daemon=True)
+            self._thread.start()
+            logger.info('Listening for commands on {:s}.'.format(self._path))
+
+        return self
+
+    def __exit__(self, *args):
+        for signum in (signal.SIGUSR1, signal.SIGUSR2, signal.SIGTERM, signal.SIGHUP):
+            signal.signal(signum, signal.SIG_DFL)
+
+        if self._socket is not None:
+            self._socket.close()
+            os.unlink(self._path)
+
+    def quit_now(self, signum, frame):
+        raise Quit('signal {:d}'.format(signum))
+
+    def attach(self, mm):
+        """Set the MacroManager which commands act on."""
+        self._mm = mm
+
+    def serve(self):
+        while True:
+            try:
+                conn, addr = self._socket.accept()
+            except OSError:
+                return  # socket was closed
+            with conn, conn.makefile('rw') as f:
+                for line in f:
+                    f.write(self.submit(line) + '\n')
+                    f.flush()
+
+    def submit(self, line):
+        """Check and queue one command line. Returns the reply for the client."""
+        command, _, arg = line.strip().partition(' ')
+        arg = arg.strip() or None
+
+        if command not in Control.commands:
+            return 'error: unknown command'
+        if command in ('macro', 'file') and arg is None:
+            return 'error: {:s} needs an argument'.format(command)
+        if command == 'macro' and arg not in macros_dict:
+            return 'error: no such macro'
+
+        if command == 'status':
+            return self.status()
+
+        self.pending.append((command, arg))
+        return 'ok'
+
+    def status(self):
+        mm = self._mm
+        if mm is None:
+            return 'starting'
+        playing = [getattr(m, '__name__', str(m)) for m in list(mm.playing_macros)]
+        return 'recording: {:s}; playing: {:s}'.format(
+            str(mm.recordmacro) if mm.recordmacro else 'nothing',
+            ', '.join(playing) if playing else 'nothing'
+        )
+
+    def run_commands(self):
+        while self.pending:
+            command, arg = self.pending.popleft()
+            logger.info('Control: {:s}{:s}'.format(command, ' ' + arg if arg else ''))
+            if command == 'quit':
+                raise Quit(command)
+            elif command == 'record':
+                self._mm.recorder_control(True)
+            elif command == 'play':
+                self._mm.recorder_control(False)
+            elif command == 'macro':
+                self._mm.play_control(macros_dict[arg])
+            elif command == 'file':
+                self._mm.play_control(pathlib.Path(arg))
@@ -15,6 +15,7 @@
 # along with switchcon.  If not, see <http://www.gnu.org/licenses/>.
 
 
+import ctypes
 import logging
 
 import sdl2
@@ -26,6 +27,10 @@ logger = logging.getLogger(__name__)
 
 class Controller(object):
 
+    # The state is updated by handle_event() and on_change is called after
+    # each update, so there is no need to call next() to find changes.
+    event_driven = True
+
     buttonmapping = [
         sdl2.SDL_CONTROLLER_BUTTON_X,  # Y
         sdl2.SDL_CONTROLLER_BUTTON_A,  # B
@@ -57,7 +62,11 @@ class Controller(object):
         sdl2.SDL_CONTROLLER_BUTTON_DPAD_LEFT,  # LEFT
     ]
 
-    hatcodes = [8, 0, 2, 1, 4, 8, 3, 8, 6, 7, 8, 8, 5, 8, 8]
+    hatcodes = [8, 0, 2, 1, 4, 8, 3, 8, 6, 7, 8, 8, 5, 8, 8, 8]
+
+    # Instance ids opened by any Controller, so two identical pads are
+    # not both claimed by the same Controller after a reconnect.
+    open_instances = set()
 
     def __init__(self, controller_id, axis_deadzone=10000, trigger_deadzone=0):
 
@@ -88,53 +97,202 @@ class Controller(object):
         self.controller = None
         self.name = 'controller {:s}'.format(controller_id)
         self.which = None
+        self.instance_id = None
+        self.guid = None
+
+        self.axis_deadzone = axis_deadzone
+        self.trigger_deadzone = trigger_deadzone
 
         try:
             n = int(controller_id, 10)
             if n < sdl2.SDL_NumJoysticks():
-                self.controller = sdl2.SDL_GameControllerOpen(n)
-                self.which = n
+                self.open(n)
         except ValueError:
             for n in range(sdl2.SDL_NumJoysticks()):
-                name = sdl2.SDL_JoystickNameForIndex(n)
-                if name is not None:
-                    name = name.decode('utf8')
-                    if name == controller_id:
-                        self.controller = sdl2.SDL_GameControllerOpen(n)
-                        self.which = n
+                if self.device_name(n) == controller_id:
+                    self.open(n)
+                    break
 
         if self.controller is None:
             raise Exception('Controller not found: {:s}'.format(controller_id))
 
+        logger.info('Using {:s} for input.'.format(self.name))
+
+        # Lookup tables from SDL button and axis numbers to what they change in the state.
+        self._button_bits = {b: 1 << n for n, b in enumerate(Controller.buttonmapping) if b != sdl2.SDL_CONTROLLER_BUTTON_INVALID}
+        self._hat_bits = {b: 1 << n for n, b in enumerate(Controller.hatmapping)}
+        self._axis_index = {a: n for n, a in enumerate(Controller.axismapping)}
+        self._trigger_bits = {
+            sdl2.SDL_CONTROLLER_AXIS_TRIGGERLEFT: 1 << 6,
+            sdl2.SDL_CONTROLLER_AXIS_TRIGGERRIGHT: 1 << 7,
+        }
+
+        # Calibration tables for the left and right sticks, and the
+        # uncalibrated 8 bit axis positions they are indexed by.
+        self._tables = None
+        self._raw = [128, 128, 128, 128]
+
+        self.on_change = None
+
+        # Read the full state once. After this it is kept up to date by handle_event().
+        self._dpad = 0
+        self.state = self.poll()
+        self.previous_state = self.state.copy()
+
+    def open(self, n):
+        self.controller = sdl2.SDL_GameControllerOpen(n)
+        self.which = n
+
+        joystick = sdl2.SDL_GameControllerGetJoystick(self.controller)
+        self.instance_id = sdl2.SDL_JoystickInstanceID(joystick)
+        Controller.open_instances.add(self.instance_id)
+
         try:
-            self.name = sdl2.SDL_JoystickName(sdl2.SDL_GameControllerGetJoystick(self.controller)).decode('utf8')
+            self.name = sdl2.SDL_JoystickName(joystick).decode('utf8')
         except AttributeError:
             pass
 
-        logger.info('Using {:s} for input.'.format(self.name))
+        guid = ctypes.create_string_buffer(33)
+        sdl2.SDL_JoystickGetGUIDString(sdl2.SDL_JoystickGetGUID(joystick), guid, len(guid))
+        self.guid = guid.value.decode('utf8')
 
-        self.axis_deadzone = axis_deadzone
-        self.trigger_deadzone = trigger_deadzone
+    def close(self):
+        Controller.open_instances.discard(self.instance_id)
+        sdl2.SDL_GameControllerClose(self.controller)
+        self.controller = None
+        self.instance_id = None
+
+    @staticmethod
+    def device_name(n):
+        name = sdl2.SDL_JoystickNameForIndex(n)
+        if name is not None:
+            return name.decode('utf8')
+
+    @staticmethod
+    def device_guid(n):
+        guid = ctypes.create_string_buffer(33)
+        sdl2.SDL_JoystickGetGUIDString(sdl2.SDL_JoystickGetDeviceGUID(n), guid, len(guid))
+        return guid.value.decode('utf8')
 
-        self.previous_state = State()
+    def matches(self, n):
+        """Check whether a newly added device is the one we lost."""
+        if sdl2.SDL_JoystickGetDeviceInstanceID(n) in Controller.open_instances:
+            return False
+        return self.device_guid(n) == self.guid or self.device_name(n) == self.name
 
     def __iter__(self):
         return self
 
     def __next__(self):
+        self.previous_state = self.state.copy()
+        return self.previous_state
+
+    def poll(self):
+        """Read the whole controller state from SDL."""
+        if self.controller is None:
+            # Neutral while unplugged.
+            self._dpad = 0
+            self._raw = [128, 128, 128, 128]
+            return State(lx=128, ly=128, rx=128, ry=128)
+
         buttons = sum([sdl2.SDL_GameControllerGetButton(self.controller, b) << n for n, b in enumerate(Controller.buttonmapping)])
         buttons |= (abs(sdl2.SDL_GameControllerGetAxis(self.controller, sdl2.SDL_CONTROLLER_AXIS_TRIGGERLEFT)) > self.trigger_deadzone) << 6
         buttons |= (abs(sdl2.SDL_GameControllerGetAxis(self.controller, sdl2.SDL_CONTROLLER_AXIS_TRIGGERRIGHT)) > self.trigger_deadzone) << 7
 
-        hat = Controller.hatcodes[sum([sdl2.SDL_GameControllerGetButton(self.controller, b) << n for n, b in enumerate(Controller.hatmapping)])]
+        self._dpad = sum([sdl2.SDL_GameControllerGetButton(self.controller, b) << n for n, b in enumerate(Controller.hatmapping)])
+        hat = Controller.hatcodes[self._dpad]
 
         rawaxis = [sdl2.SDL_GameControllerGetAxis(self.controller, n) for n in Controller.axismapping]
-        axis = [((0 if abs(x) < self.axis_deadzone else x) >> 8) + 128 for x in rawaxis]
+        if self._tables is None:
+            axis = [self.scale_axis(x) for x in rawaxis]
+        else:
+            self._raw = [(x >> 8) + 128 for x in rawaxis]
+            axis = [0, 0, 0, 0]
+            for stick in range(2):
+                axis[2 * stick:2 * stick + 2] = self.lookup_stick(stick)
 
-        state = State(buttons, hat, *axis)
         # TODO: quantize
-        self.previous_state = state
-        return state
+        return State(buttons, hat, *axis)
+
+    def calibrate(self, tables):
+        """Use (left, right) tables from load_calibration() instead of the square deadzone."""
+        self._tables = tables
+        self.state = self.poll()
+        self.changed()
+
+    def scale_axis(self, value):
+        return ((0 if abs(value) < self.axis_deadzone else value) >> 8) + 128
+
+    def lookup_stick(self, stick):
+        v = self._tables[stick][self._raw[2 * stick] << 8 | self._raw[2 * stick + 1]]
+        return v >> 8, v & 0xff
+
+    def handle_event(self, event):
+        """
+        Update the state from an SDL event. Events for other controllers
+        and other event types are ignored.
+        """
+        if event.type == sdl2.SDL_CONTROLLERAXISMOTION:
+            if event.caxis.which != self.instance_id:
+                return
+            axis = event.caxis.axis
+            if axis in self._axis_index:
+                n = self._axis_index[axis]
+                if self._tables is None:
+                    self.state._axes[n] = self.scale_axis(event.caxis.value)
+                else:
+                    self._raw[n] = (event.caxis.value >> 8) + 128
+                    stick = n >> 1
+                    self.state._axes[2 * stick:2 * stick + 2] = self.lookup_stick(stick)
+            elif axis in self._trigger_bits:
+                if abs(event.caxis.value) > self.trigger_deadzone:
+                    self.state.buttons |= self._trigger_bits[axis]
+                else:
+                    self.state.buttons &= ~self._trigger_bits[axis]
+            else:
+                return
+            self.changed()
+
+        elif event.type == sdl2.SDL_CONTROLLERBUTTONDOWN or event.type == sdl2.SDL_CONTROLLERBUTTONUP:
+            if event.cbutton.which != self.instance_id:
+                return
+            button = event.cbutton.button
+            pressed = event.type == sdl2.SDL_CONTROLLERBUTTONDOWN
+            if button in self._button_bits:
+                if pressed:
+                    self.state.buttons |= self._button_bits[button]
+                else:
+                    self.state.buttons &= ~self._button_bits[button]
+            elif button in self._hat_bits:
+                if pressed:
+                    self._dpad |= self._hat_bits[button]
+                else:
+                    self._dpad &= ~self._hat_bits[button]
+                self.state.hat = Controller.hatcodes[self._dpad]
+            else:
+                return
+            self.changed()
+
+        elif event.type == sdl2.SDL_CONTROLLERDEVICEREMOVED:
+            if event.cdevice.which != self.instance_id:
+                return
+            logger.warning('{:s} was disconnected.'.format(self.name))
+            self.close()
+            self.state = self.poll()
+            self.changed()
+
+        elif event.type == sdl2.SDL_CONTROLLERDEVICEADDED:
+            # For this event, which is the device index.
+            if self.controller is not None or not self.matches(event.cdevice.which):
+                return
+            self.open(event.cdevice.which)
+            logger.warning('{:s} was reconnected.'.format(self.name))
+            self.state = self.poll()
+            self.changed()
+
+    def changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
 
     @staticmethod
     def enumerate():
@@ -0,0 +1,401 @@
+# This file is part of switchcon
+# Copyright (C) 2018  Alistair Buxton <a.j.buxton@gmail.com>
+#
+# switchcon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# switchcon is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with switchcon.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import fcntl
+import logging
+import os
+import stat
+import struct
+
+from .state import State
+
+logger = logging.getLogger(__name__)
+
+
+# struct input_event: struct timeval, __u16 type, __u16 code, __s32 value.
+EVENT = struct.Struct('llHHi')
+# struct input_absinfo: value, minimum, maximum, fuzz, flat, resolution.
+ABSINFO = struct.Struct('6i')
+
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+
+SYN_REPORT = 0
+SYN_DROPPED = 3
+
+BTN_SOUTH = 0x130
+BTN_EAST = 0x131
+BTN_NORTH = 0x133
+BTN_WEST = 0x134
+BTN_TL = 0x136
+BTN_TR = 0x137
+BTN_TL2 = 0x138
+BTN_TR2 = 0x139
+BTN_SELECT = 0x13a
+BTN_START = 0x13b
+BTN_MODE = 0x13c
+BTN_THUMBL = 0x13d
+BTN_THUMBR = 0x13e
+BTN_DPAD_UP = 0x220
+BTN_DPAD_DOWN = 0x221
+BTN_DPAD_LEFT = 0x222
+BTN_DPAD_RIGHT = 0x223
+KEY_MAX = 0x2ff
+
+ABS_X = 0x00
+ABS_Y = 0x01
+ABS_Z = 0x02
+ABS_RX = 0x03
+ABS_RY = 0x04
+ABS_RZ = 0x05
+ABS_HAT0X = 0x10
+ABS_HAT0Y = 0x11
+
+
+def _IOR(type, nr, size):
+    return (2 << 30) | (size << 16) | (ord(type) << 8) | nr
+
+
+EVIOCGID = _IOR('E', 0x02, 8)
+
+
+def EVIOCGKEY(length):
+    return _IOR('E', 0x18, length)
+
+
+def EVIOCGABS(abs):
+    return _IOR('E', 0x40 + abs, ABSINFO.size)
+
+
+class EvdevController(object):
+    """
+    Reads a gamepad directly from /dev/input/eventN, without SDL.
+
+    Events are applied to a pending state which only becomes visible when
+    the kernel sends SYN_REPORT, so a report never contains half of an
+    input frame. For a device, reads are non-blocking and fileno() can be
+    registered with select or epoll.
+
+    The path can also be a file of raw input_event structs, for example
+    captured with cat /dev/input/eventN > capture. In that case each call
+    to next() returns the state after the next SYN_REPORT and iteration
+    stops at the end of the file.
+    """
+
+    # Key codes to button bits, in the same layout as Controller.
+    buttonmapping = {
+        BTN_WEST: 1 << 0,  # Y
+        BTN_SOUTH: 1 << 1,  # B
+        BTN_EAST: 1 << 2,  # A
+        BTN_NORTH: 1 << 3,  # X
+        BTN_TL: 1 << 4,  # L
+        BTN_TR: 1 << 5,  # R
+        BTN_TL2: 1 << 6,  # ZL
+        BTN_TR2: 1 << 7,  # ZR
+        BTN_SELECT: 1 << 8,  # SELECT
+        BTN_START: 1 << 9,  # START
+        BTN_THUMBL: 1 << 10,  # LCLICK
+        BTN_THUMBR: 1 << 11,  # RCLICK
+        BTN_MODE: 1 << 12,  # HOME
+    }
+
+    # Key codes to d-pad bits, in the same order as Controller.hatmapping.
+    dpadmapping = {
+        BTN_DPAD_UP: 1 << 0,
+        BTN_DPAD_RIGHT: 1 << 1,
+        BTN_DPAD_DOWN: 1 << 2,
+        BTN_DPAD_LEFT: 1 << 3,
+    }
+
+    axismapping = {
+        ABS_X: 0,  # LX
+        ABS_Y: 1,  # LY
+        ABS_RX: 2,  # RX
+        ABS_RY: 3,  # RY
+    }
+
+    # Analog triggers to button bits.
+    triggermapping = {
+        ABS_Z: 1 << 6,  # ZL
+        ABS_RZ: 1 << 7,  # ZR
+    }
+
+    hatcodes = [8, 0, 2, 1, 4, 8, 3, 8, 6, 7, 8, 8, 5, 8, 8, 8]
+
+    # Ranges to assume when there is no device to ask, as (minimum, maximum, flat).
+    default_ranges = {
+        ABS_X: (-32768, 32767, 10000),
+        ABS_Y: (-32768, 32767, 10000),
+        ABS_RX: (-32768, 32767, 10000),
+        ABS_RY: (-32768, 32767, 10000),
+        ABS_Z: (0, 255, 0),
+        ABS_RZ: (0, 255, 0),
+    }
+
+    def __init__(self, path, batch=64):
+        self.name = path
+        self._batch = EVENT.size * batch
+
+        self._device = stat.S_ISCHR(os.stat(path).st_mode)
+        # A device updates the state from pump(), and calls on_change when
+        # a frame is committed. A file has to be read with next().
+        self.event_driven = self._device
+        self.on_change = None
+        if self._device:
+            self._fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        else:
+            self._fd = os.open(path, os.O_RDONLY)
+
+        self._buffer = b''
+        self._dropped = False
+
+        # Per axis, a function from the raw value to 0-255. Per trigger,
+        # the raw value above which the button is pressed.
+        self._ranges = {}
+        self._axes = {}
+        self._thresholds = {}
+        for code in list(EvdevController.axismapping) + list(EvdevController.triggermapping):
+            minimum, maximum, flat = self._ranges[code] = self.absinfo(code)
+            if code in EvdevController.axismapping:
+                self._axes[code] = self.make_scale(minimum, maximum, flat)
+            else:
+                self._thresholds[code] = (minimum + maximum) // 2
+
+        # Calibration tables for the left and right sticks, and the
+        # uncalibrated 8 bit axis positions they are indexed by.
+        self._tables = None
+        self._raw = [128, 128, 128, 128]
+        self.guid = self.read_guid()
+
+        self._buttons = 0
+        self._dpad = 0
+        self._hat_x = 0
+        self._hat_y = 0
+        self.pending = State(lx=128, ly=128, rx=128, ry=128)
+
+        if self._device:
+            self.resync()
+
+        self.state = self.pending.copy()
+
+        logger.info('Using {:s} for input.'.format(self.name))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._device:
+            self.pump()
+        elif not self.read_frame():
+            raise StopIteration
+        return self.state.copy()
+
+    def fileno(self):
+        return self._fd
+
+    def calibrate(self, tables):
+        """Use (left, right) tables from load_calibration() instead of the device's flat zone."""
+        self._tables = tables
+        for code in EvdevController.axismapping:
+            minimum, maximum, flat = self._ranges[code]
+            self._axes[code] = self.make_scale(minimum, maximum, 0)
+        if self._device:
+            self.resync()
+            self.state = self.pending.copy()
+
+    def read_guid(self):
+        """Returns the device ID formatted like an SDL joystick GUID, or None for a file."""
+        if not self._device:
+            return None
+        buf = bytearray(8)
+        try:
+            fcntl.ioctl(self._fd, EVIOCGID, buf)
+        except OSError:
+            return None
+        bustype, vendor, product, version = struct.unpack('<4H', buf)
+        return struct.pack('<8H', bustype, 0, vendor, 0, product, 0, version, 0).hex()
+
+    def close(self):
+        os.close(self._fd)
+
+    def absinfo(self, code):
+        """Returns (minimum, maximum, flat) for an axis."""
+        if self._device:
+            try:
+                buf = bytearray(ABSINFO.size)
+                fcntl.ioctl(self._fd, EVIOCGABS(code), buf)
+                value, minimum, maximum, fuzz, flat, resolution = ABSINFO.unpack(buf)
+                if maximum > minimum:
+                    return minimum, maximum, flat
+            except OSError:
+                pass
+        return EvdevController.default_ranges[code]
+
+    @staticmethod
+    def make_scale(minimum, maximum, flat):
+        centre = (minimum + maximum) / 2
+        span = maximum - minimum
+
+        def scale(value):
+            if abs(value - centre) <= flat:
+                return 128
+            return min(255, max(0, ((value - minimum) * 256) // span))
+
+        return scale
+
+    def resync(self):
+        """Read the whole state from the device, after opening or when events were dropped."""
+        keys = bytearray((KEY_MAX + 8) // 8)
+        try:
+            fcntl.ioctl(self._fd, EVIOCGKEY(len(keys)), keys)
+        except OSError:
+            pass
+
+        def pressed(code):
+            return (keys[code >> 3] >> (code & 7)) & 1
+
+        self._buttons = sum(bit for code, bit in EvdevController.buttonmapping.items() if pressed(code))
+        self._dpad = sum(bit for code, bit in EvdevController.dpadmapping.items() if pressed(code))
+        self._hat_x = self._hat_y = 0
+
+        for code in list(EvdevController.axismapping) + list(EvdevController.triggermapping) + [ABS_HAT0X, ABS_HAT0Y]:
+            buf = bytearray(ABSINFO.size)
+            try:
+                fcntl.ioctl(self._fd, EVIOCGABS(code), buf)
+            except OSError:
+                continue
+            self.apply(EV_ABS, code, ABSINFO.unpack(buf)[0])
+
+        self.update_buttons()
+
+    def update_buttons(self):
+        dpad = self._dpad
+        if self._hat_y < 0:
+            dpad |= 1 << 0
+        elif self._hat_y > 0:
+            dpad |= 1 << 2
+        if self._hat_x > 0:
+            dpad |= 1 << 1
+        elif self._hat_x < 0:
+            dpad |= 1 << 3
+        self.pending.hat = EvdevController.hatcodes[dpad]
+        self.pending.buttons = self._buttons
+
+    def apply(self, type, code, value):
+        """Apply one event to the pending state."""
+        if type == EV_KEY:
+            if code in EvdevController.buttonmapping:
+                if value:
+                    self._buttons |= EvdevController.buttonmapping[code]
+                else:
+                    self._buttons &= ~EvdevController.buttonmapping[code]
+            elif code in EvdevController.dpadmapping:
+                if value:
+                    self._dpad |= EvdevController.dpadmapping[code]
+                else:
+                    self._dpad &= ~EvdevController.dpadmapping[code]
+
+        elif type == EV_ABS:
+            if code in self._axes:
+                n = EvdevController.axismapping[code]
+                if self._tables is None:
+                    self.pending._axes[n] = self._axes[code](value)
+                else:
+                    self._raw[n] = self._axes[code](value)
+                    stick = n >> 1
+                    v = self._tables[stick][self._raw[2 * stick] << 8 | self._raw[2 * stick + 1]]
+                    self.pending._axes[2 * stick:2 * stick + 2] = v >> 8, v & 0xff
+            elif code in self._thresholds:
+                if value > self._thresholds[code]:
+                    self._buttons |= EvdevController.triggermapping[code]
+                else:
+                    self._buttons &= ~EvdevController.triggermapping[code]
+            elif code == ABS_HAT0X:
+                self._hat_x = value
+            elif code == ABS_HAT0Y:
+                self._hat_y = value
+
+    def process(self, data):
+        """
+        Apply a batch of raw events. Returns True if at least one complete
+        frame was committed to the state.
+        """
+        committed = False
+        for sec, usec, type, code, value in EVENT.iter_unpack(data):
+            if type == EV_SYN:
+                if code == SYN_REPORT:
+                    if self._dropped:
+                        # The events since SYN_DROPPED are incomplete.
+                        self._dropped = False
+                        if self._device:
+                            self.resync()
+                    self.update_buttons()
+                    self.state = self.pending.copy()
+                    committed = True
+                elif code == SYN_DROPPED:
+                    logger.warning('{:s}: input events were dropped.'.format(self.name))
+                    self._dropped = True
+            elif not self._dropped:
+                self.apply(type, code, value)
+        if committed and self.on_change is not None:
+            self.on_change(self)
+        return committed
+
+    def pump(self):
+        """Read and apply everything the device has queued, without blocking."""
+        while True:
+            try:
+                data = os.read(self._fd, self._batch)
+            except BlockingIOError:
+                return
+            if not data:
+                return
+            self.process(data)
+            if len(data) < self._batch:
+                return
+
+    def read_frame(self):
+        """Read from a file until one frame has been committed. Returns False at end of file."""
+        offset = 0
+        while True:
+            for offset in range(offset, len(self._buffer) - EVENT.size + 1, EVENT.size):
+                sec, usec, type, code, value = EVENT.unpack_from(self._buffer, offset)
+                if type == EV_SYN and code == SYN_REPORT:
+                    end = offset + EVENT.size
+                    self.process(self._buffer[:end])
+                    self._buffer = self._buffer[end:]
+                    return True
+            else:
+                offset = len(self._buffer) - (len(self._buffer) % EVENT.size)
+            data = os.read(self._fd, self._batch)
+            if not data:
+                return False
+            self._buffer += data
+
+
+def write_events(f, events):
+    """Write (type, code, value) tuples to a file as raw input_event structs."""
+    for type, code, value in events:
+        f.write(EVENT.pack(0, 0, type, code, value))
+
+
+if __name__ == '__main__':
+    import sys
+
+    for state in EvdevController(sys.argv[1]):
+        print(state.hexstr)
@@ -83,3 +83,45 @@ class NotExist(Directory):
         path = object.__getattribute__(self, 'path')
         os.makedirs(path, exist_ok=True)
         Directory.__setattr__(self, key, value)
+
+
+def read_attributes(directory, keys):
+    """
+    Read a set of attribute files from a directory in one pass, returning
+    a dict of stripped values. Missing attributes are returned as None.
+    Unlike attribute access on Directory this does not stat() each path.
+    """
+    path = object.__getattribute__(directory, 'path')
+    values = {}
+    for key in keys:
+        try:
+            with open(os.path.join(path, key), 'r') as f:
+                values[key] = f.read().strip()
+        except (FileNotFoundError, NotADirectoryError):
+            values[key] = None
+    return values
+
+
+def same_value(a, b):
+    """Compare two attribute values. configfs reformats numbers on read, eg 0x0 reads back as 0x00."""
+    if a is None or b is None:
+        return a == b
+    try:
+        return int(a, 0) == int(b, 0)
+    except ValueError:
+        return a.strip() == b.strip()
+
+
+def update_attributes(directory, values, snapshot=None):
+    """
+    Write only the attributes which differ from the snapshot, and update
+    the snapshot to match. If no snapshot is given the current values are
+    read first. Returns the list of attributes that were written.
+    """
+    if snapshot is None:
+        snapshot = read_attributes(directory, values.keys())
+    changed = [k for k, v in values.items() if not same_value(snapshot.get(k), v)]
+    for k in changed:
+        directory[k] = values[k]
+        snapshot[k] = values[k]
+    return changed
@@ -48,12 +48,14 @@ class USBHIDDescriptor(functionfs.USBDescriptorHeader):
 
 
 class HIDFunction(functionfs.Function):
-    def __init__(self, gadget, report_desc):
+    def __init__(self, gadget, report_desc, interval=5, index=0):
 
         self.gadget = gadget
         self.report_desc = report_desc
 
         self._report_requested = False
+        # Set when attaching to a gadget the host may already have enumerated.
+        self.start_on_enable = False
 
         descriptors = [
 
@@ -82,7 +84,7 @@ class HIDFunction(functionfs.Function):
                 bEndpointAddress=1 | functionfs.ch9.USB_DIR_IN,
                 bmAttributes=functionfs.ch9.USB_ENDPOINT_XFER_INT,
                 wMaxPacketSize=64,
-                bInterval=5,
+                bInterval=interval,
             ),
 
             functionfs.getDescriptor(
@@ -90,12 +92,12 @@ class HIDFunction(functionfs.Function):
                 bEndpointAddress=2 | functionfs.ch9.USB_DIR_OUT,
                 bmAttributes=functionfs.ch9.USB_ENDPOINT_XFER_INT,
                 wMaxPacketSize=64,
-                bInterval=5,
+                bInterval=interval,
             )
         ]
 
         super().__init__(
-            self.gadget.mount_point,
+            self.gadget.mount_points[index],
             fs_list=descriptors,
             hs_list=descriptors,
             lang_dict={
@@ -118,3 +120,10 @@ class HIDFunction(functionfs.Function):
             self._report_requested = True
         else:
             super().onSetup(request_type, request, value, index, length)
+
+    def onEnable(self):
+        logger.debug('Function enabled')
+        # Endpoints only work once the host has enabled the function.
+        if self.start_on_enable:
+            self._report_requested = True
+        super().onEnable()
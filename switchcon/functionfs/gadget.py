@@ -21,31 +21,54 @@ import subprocess
 
 logger = logging.getLogger(__name__)
 
-from .configfs import Directory, NotExist
+from .configfs import Directory, NotExist, read_attributes, update_attributes
 
 
 class Gadget(object):
     CONFIGDIR = '/sys/kernel/config/usb_gadget/'
 
-    def __init__(self, name, udc, device_params, device_strings, make_function):
+    def __init__(self, name, udc, device_params, device_strings, make_function, attach=False, functions=1):
         self._name = name
         self._udc = udc
         self._device_params = device_params
         self._device_strings = device_strings
         self._make_function = make_function
-        self._function = None
+        self._functions = []
+        self._attach = attach
+
+        # A single function keeps the plain gadget name. A composite gadget
+        # gets one numbered functionfs instance per function.
+        if functions == 1:
+            self._instances = [name]
+        else:
+            self._instances = ['{:s}{:d}'.format(name, n) for n in range(functions)]
 
         self._configfs = Directory(Gadget.CONFIGDIR)[self._name]
 
+    @property
+    def mount_points(self):
+        return ['/dev/ffs-' + instance for instance in self._instances]
+
     @property
     def mount_point(self):
-        return '/dev/ffs-' + self._name
+        return self.mount_points[0]
+
+    @property
+    def functions(self):
+        return self._functions
 
     @property
     def function(self):
-        return self._function
+        return self._functions[0]
+
+    @property
+    def ep0(self):
+        return self.function.ep0
 
     def __enter__(self):
+        if self._attach and self.attachable():
+            return self.reattach()
+
         logger.debug('Creating functionfs')
 
         for k, v in self._device_params.items():
@@ -56,36 +79,131 @@ class Gadget(object):
 
         self._configfs.configs['c.1'].MaxPower = '250'
 
-        self.add_function_to_config('ffs.' + self._name, 'c.1')
+        for instance in self._instances:
+            self.add_function_to_config('ffs.' + instance, 'c.1')
 
-        os.makedirs(self.mount_point, exist_ok=True)
-        subprocess.call(['mount', '-c', '-t', 'functionfs', self._name, self.mount_point])
+        self.mount()
 
-        self._function = self._make_function(self)
+        self.make_functions()
 
         self.bind()
 
         return self
 
     def __exit__(self, *args):
+        if self._attach:
+            # Leave the gadget bound so the host does not see a disconnect.
+            # The functions are mounted with no_disconnect, so closing ep0
+            # only deactivates them until the next attach.
+            logger.info('Detaching from functionfs')
+            self.close_functions()
+            return
+
         logger.info('Tearing down functionfs')
 
         self.unbind()
 
-        if self._function is not None:
-            self._function.close()
+        self.close_functions()
 
-        if subprocess.call(['umount', self.mount_point]):
-            logger.info("Can't unmount functionfs because it is still in use.")
-            return
+        for instance, mount_point in zip(self._instances, self.mount_points):
+            if subprocess.call(['umount', mount_point]):
+                logger.info("Can't unmount functionfs because it is still in use.")
+                return
 
-        self.remove_function_from_config('ffs.' + self._name, 'c.1')
-        del self._configfs.functions['ffs.' + self._name]
+        for instance in self._instances:
+            self.remove_function_from_config('ffs.' + instance, 'c.1')
+            del self._configfs.functions['ffs.' + instance]
         del self._configfs.configs['c.1']
         del self._configfs.strings['0x409']
 
         self.remove_gadget()
 
+    def make_functions(self):
+        self._functions = [self._make_function(self, n) for n in range(len(self._instances))]
+
+    def close_functions(self):
+        for function in self._functions:
+            function.close()
+
+    def mounted(self):
+        mounted = set()
+        with open('/proc/mounts', 'r') as mounts:
+            for line in mounts:
+                fields = line.split()
+                if fields[2] == 'functionfs':
+                    mounted.add(fields[1])
+        return mounted
+
+    def mount(self):
+        mounted = self.mounted()
+        for instance, mount_point in zip(self._instances, self.mount_points):
+            if mount_point in mounted:
+                continue
+            os.makedirs(mount_point, exist_ok=True)
+            if self._attach:
+                subprocess.call(['mount', '-c', '-t', 'functionfs', '-o', 'no_disconnect=1', instance, mount_point])
+            else:
+                subprocess.call(['mount', '-c', '-t', 'functionfs', instance, mount_point])
+
+    def attachable(self):
+        """Check whether a gadget with all of our functions in its config already exists."""
+        path = os.path.join(Gadget.CONFIGDIR, self._name)
+        return all(
+            os.path.isdir(os.path.join(path, 'functions', 'ffs.' + instance))
+            and os.path.islink(os.path.join(path, 'configs', 'c.1', 'ffs.' + instance))
+            for instance in self._instances
+        )
+
+    def reattach(self):
+        """
+        Reuse an existing gadget. Only attributes which differ from the
+        running gadget are written, and the UDC is only rebound if it is
+        not still bound to the requested UDC once the functions are open.
+        """
+        logger.info('Attaching to existing gadget {}'.format(self._name))
+
+        snapshot = read_attributes(self._configfs, list(self._device_params.keys()) + ['UDC'])
+
+        try:
+            changed = self.update_attributes(snapshot)
+        except OSError:
+            # Some attributes can't be changed while bound.
+            logger.info('Unbinding to update gadget attributes.')
+            self.unbind()
+            changed = self.update_attributes(snapshot)
+
+        if changed:
+            logger.info('Updated gadget attributes: {}'.format(', '.join(changed)))
+
+        self.mount()
+
+        self.make_functions()
+
+        # The host won't ask for the report descriptor again if it doesn't
+        # re-enumerate us, so start sending reports when it enables the
+        # function instead.
+        for function in self._functions:
+            function.start_on_enable = True
+
+        # Opening ep0 resets a function which was deactivated with
+        # no_disconnect, which can unregister the gadget, so the UDC has to
+        # be read again here rather than trusting the snapshot.
+        udc = read_attributes(self._configfs, ['UDC'])['UDC']
+        if udc != self._udc:
+            if udc:
+                # Bound to a different UDC, which has to be released first.
+                logger.info('Unbinding from {}.'.format(udc))
+                self.unbind()
+            self.bind()
+
+        return self
+
+    def update_attributes(self, snapshot):
+        changed = update_attributes(self._configfs, self._device_params, snapshot)
+        changed += update_attributes(self._configfs.strings['0x409'], self._device_strings)
+        changed += update_attributes(self._configfs.configs['c.1'], {'MaxPower': '250'})
+        return changed
+
     def add_function_to_config(self, function, config):
         if type(self._configfs.functions[function]) == NotExist:
             self._configfs.functions[function] = None
@@ -103,14 +221,3 @@ class Gadget(object):
 
     def remove_gadget(self):
         del Directory(Gadget.CONFIGDIR)[self._name]
-
-    def processEvents(self):
-        self._function.processEvents()
-
-    @property
-    def _report_requested(self):
-        return self._function._report_requested
-
-    @property
-    def _ep_list(self):
-        return self._function._ep_list
@@ -43,7 +43,7 @@ udc_eps = {
 
 class Gadget(functionfs.Function):
 
-    def __init__(self, udc, device_params, device_strings, report_desc):
+    def __init__(self, udc, device_params, device_strings, report_desc, interval=5):
 
         self.udc = udc
 
@@ -86,7 +86,7 @@ class Gadget(functionfs.Function):
             bEndpointAddress=1 | functionfs.ch9.USB_DIR_IN,
             bmAttributes=functionfs.ch9.USB_ENDPOINT_XFER_INT,
             wMaxPacketSize=64,
-            bInterval=5,
+            bInterval=interval,
         )
 
         self.ep2des = functionfs.getDescriptor(
@@ -94,7 +94,7 @@ class Gadget(functionfs.Function):
             bEndpointAddress=2 | functionfs.ch9.USB_DIR_OUT,
             bmAttributes=functionfs.ch9.USB_ENDPOINT_XFER_INT,
             wMaxPacketSize=64,
-            bInterval=5,
+            bInterval=interval,
         )
 
         self.confdes = functionfs.getDescriptor(
@@ -193,6 +193,11 @@ class Gadget(functionfs.Function):
         logger.warning('Unhandled setup request {:02x} {:02x} {:02x} {:02x} {:02x}'.format(request_type, request, value, index, length))
         super().onSetup(request_type, request, value, index, length)
 
+    @property
+    def functions(self):
+        # gadgetfs can only provide one function, which is the gadget itself.
+        return [self]
+
     def processEvents(self):
         req = self.ep0.read(12)
         if req is not None and len(req) == 12:
@@ -18,173 +18,340 @@
 import binascii
 import logging
 import select
+import struct
 import time
 
-import serial
-
-from .functionfs import Gadget, HIDFunction
-from .gadgetfs import Gadget as GadgetFS
-from .kaio import KAIOReader, KAIOWriter
+from .profiles import horipad
 from .state import State
 
 logger = logging.getLogger(__name__)
 
-class Serial(object):
 
-    def __init__(self, port='/dev/ttyUSB0', baud_rate=115200):
+class PollRateMeter(object):
+    """Measures how often the host collects reports, and logs it periodically."""
+
+    def __init__(self, period=5.0):
+        self._period = period
+        self._start = None
+        self._prev = None
+        self._count = 0
+        self._min = None
+        self._max = 0
+
+    def tick(self):
+        now = time.perf_counter()
+        if self._start is None:
+            self._start = self._prev = now
+            return
+
+        gap = now - self._prev
+        self._prev = now
+        self._count += 1
+        if self._min is None or gap < self._min:
+            self._min = gap
+        if gap > self._max:
+            self._max = gap
+
+        if now - self._start >= self._period:
+            logger.info('Host poll rate: {:.1f} Hz (interval min {:.2f} ms, max {:.2f} ms)'.format(
+                self._count / (now - self._start), 1000 * self._min, 1000 * self._max
+            ))
+            self._start = now
+            self._count = 0
+            self._min = None
+            self._max = 0
+
+
+class Serial(object):
+    """
+    Sends states to the Arduino firmware as lines of hex.
+
+    Normally the firmware sends 'S' after every report it gives the Switch
+    and a state is written in reply. With changes_only, the firmware is
+    told to stop sending 'S' ('Q') and keeps repeating the last state it
+    was given. Input is then sampled every interval seconds and a state is
+    only written when it differs from the last one, or when keepalive
+    seconds have passed. 'V' restores the default behaviour on exit.
+    """
+
+    def __init__(self, port='/dev/ttyUSB0', baud_rate=115200, meter=None, changes_only=False, keepalive=1.0, interval=0.005):
         self._port = port
         self._baud_rate = baud_rate
+        self._meter = meter
         self._file = None
         self._arduino_alive = None
         self._ping_sent = False
+        self._changes_only = changes_only
+        self._keepalive = keepalive
+        self._interval = interval
+        self._next_poll = None
+        self._last_line = None
+        self._last_write = None
+        self._last_response = None
 
     def __enter__(self):
+        import serial
+
         self._file = serial.Serial(
             self._port, self._baud_rate,
             bytesize=serial.EIGHTBITS, parity=serial.PARITY_NONE,
             stopbits=serial.STOPBITS_ONE, timeout=0.1
         )
         logger.info('Using {:s} at {:d} baud for comms.'.format(self._port, self._baud_rate))
+        if self._changes_only:
+            self._file.write(b'Q')
+            self._next_poll = self._last_write = self._last_response = time.monotonic()
         return self
 
     def __exit__(self, *args):
+        if self._changes_only:
+            self._file.write(b'V')
+            self._file.flush()
         self._file.close()
 
+    @property
+    def players(self):
+        return 1
 
-    def poll(self):
-        response = self._file.read(1)
-        if response:
-            if self._arduino_alive is not True:
-                logger.warning('Arduino is connected.')
-                self._arduino_alive = True
-            self._ping_sent = False
+    def response(self, response):
+        """Handle one character from the Arduino. Returns True for 'S'."""
+        if self._arduino_alive is not True:
+            logger.warning('Arduino is connected.')
+            self._arduino_alive = True
+        self._ping_sent = False
 
-            if response == b'S':
-                # Arduino has sent a report to the switch and its endpoint is ready for more data
-                return True
+        if response == b'S':
+            # Arduino has sent a report to the switch and its endpoint is ready for more data
+            if self._meter is not None:
+                self._meter.tick()
+            return True
 
-            elif response == b'R':
-                # Arduino received data from the Switch
-                logger.info('Arduino received data from the Switch.')
-                return False
+        elif response == b'R':
+            # Arduino received data from the Switch
+            logger.info('Arduino received data from the Switch.')
 
-            elif response == b'O':
-                logger.error('Arduino reported buffer overrun.')
-                return False
+        elif response == b'O':
+            logger.error('Arduino reported buffer overrun.')
 
-            elif response == b'P':
-                # Arduino replied to a ping
-                return False
+        elif response == b'P':
+            # Arduino replied to a ping
+            pass
 
-            else:
-                logger.error('Unexpected character from Arduino.')
-                return False
+        else:
+            logger.error('Unexpected character from Arduino.')
+
+        return False
+
+    def ping(self):
+        if self._arduino_alive is not False and self._ping_sent:
+            logger.warning('Arduino is not responding.')
+            self._arduino_alive = False
+        self._file.write(b'P')
+        self._ping_sent = True
+
+    def poll(self):
+        """Returns the list of players ready for a new state. Serial only has player 0."""
+        if self._changes_only:
+            return self.poll_changes()
+
+        response = self._file.read(1)
+        if response:
+            return [0] if self.response(response) else []
 
         else:
             # Serial time out.
-            if self._arduino_alive is not False and self._ping_sent:
-                logger.warning('Arduino is not responding.')
-                self._arduino_alive = False
-            self._file.write(b'P')
-            self._ping_sent = True
-            return False
-
-    def write(self, state):
-        self._file.write(state.hex + b'\n')
+            self.ping()
+            return []
+
+    def poll_changes(self):
+        now = time.monotonic()
+        if now < self._next_poll:
+            time.sleep(self._next_poll - now)
+            now = self._next_poll
+        self._next_poll = max(self._next_poll + self._interval, now)
+
+        # An 'S' here means the firmware did not understand 'Q', or was reset.
+        waiting = self._file.in_waiting
+        if waiting:
+            for c in self._file.read(waiting):
+                self.response(bytes([c]))
+            self._last_response = now
+        elif now - self._last_response > self._keepalive:
+            self.ping()
+            self._last_response = now
+
+        return [0]
+
+    def write(self, state, player=0):
+        line = state.hex
+        if self._changes_only:
+            now = time.monotonic()
+            if line == self._last_line and now - self._last_write < self._keepalive:
+                return
+            self._last_line = line
+            self._last_write = now
+            # Repeat 'Q' in case the Arduino has been reset since we started.
+            self._file.write(b'Q' + line + b'\n')
+        else:
+            self._file.write(line + b'\n')
 
 
 class GadgetWrapper(object):
-    def __init__(self, gadget):
+    """
+    Services the endpoints of every function of a gadget from one epoll
+    set. Each function is one player.
+    """
+
+    EP0, EP1, EP2 = range(3)
+
+    def __init__(self, gadget, reader=None, writer=None, report_format='<HBBBBB', meter=None):
+        if reader is None or writer is None:
+            from .kaio import KAIOReader, KAIOWriter
+            reader, writer = KAIOReader, KAIOWriter
+
         self._gadget = gadget
-        self._ready = False
+        self._reader = reader
+        self._writer = writer
+        self._report = struct.Struct(report_format)
+        self._meter = meter
+        self._epoll = None
 
     def __enter__(self):
         self._gadget.__enter__()
+
+        functions = self._gadget.functions
+        self.ep1 = [None] * len(functions)
+        self.ep2 = [None] * len(functions)
+        self._waiting = set(range(len(functions)))
+
+        # ep0 goes in the same epoll set as the endpoint eventfds so that
+        # setup requests are handled as soon as they arrive, instead of
+        # reading ep0 on every loop iteration.
+        self._epoll = select.epoll()
+        self._fds = {}
+        for n, function in enumerate(functions):
+            self._register(function.ep0.fileno(), GadgetWrapper.EP0, n)
         return self
 
     def __exit__(self, *args):
-        self.ep1.close()
-        self.ep2.close()
+        self._epoll.close()
+        for ep in self.ep1 + self.ep2:
+            if ep is not None:
+                ep.close()
         self._gadget.__exit__(*args)
 
+    @property
+    def players(self):
+        return len(self._gadget.functions)
+
+    def _register(self, fd, kind, player):
+        self._fds[fd] = (kind, player)
+        self._epoll.register(fd, select.EPOLLIN)
+
+    def _start(self, player):
+        ep_list = self._gadget.functions[player]._ep_list
+        self.ep1[player] = self._writer(ep_list[1])
+        self.ep2[player] = self._reader(ep_list[2])
+        self._register(self.ep1[player].evfd, GadgetWrapper.EP1, player)
+        self._register(self.ep2[player].evfd, GadgetWrapper.EP2, player)
+        self.write(State(), player)
+        self.ep2[player].submit()
+        self._waiting.discard(player)
+
     def poll(self):
-        self._gadget.processEvents()
-        if self._ready:
-            result = select.select([self.ep1.evfd, self.ep2.evfd], [], [], 0.1)
+        """Returns the list of players ready for a new state."""
+        ready = []
+
+        for fd, event in self._epoll.poll(0.1):
+            kind, player = self._fds[fd]
 
-            if self.ep2.evfd in result[0]:
-                logger.info('Got data from host: {:s}'.format(binascii.hexlify(self.ep2.read())))
-                self.ep2.submit()
+            if kind == GadgetWrapper.EP0:
+                self._gadget.functions[player].processEvents()
 
-            if self.ep1.evfd in result[0]:
+            elif kind == GadgetWrapper.EP2:
+                logger.info('Got data from host for player {:d}: {:s}'.format(
+                    player, binascii.hexlify(self.ep2[player].read()).decode('utf8')
+                ))
+
+            else:
                 logger.debug('Write completed')
-                self.ep1.pump()
-                return True
-        else:
-            if self._gadget._report_requested:
-                self.ep1 = KAIOWriter(self._gadget._ep_list[1])
-                self.ep2 = KAIOReader(self._gadget._ep_list[2])
-                self.ep1.write(State().bytes)
-                self.ep2.submit()
-                self._ready = True
-                return True
+                self.ep1[player].pump()
+                if self._meter is not None and player == 0:
+                    self._meter.tick()
+                ready.append(player)
 
-        return False
+        for player in list(self._waiting):
+            if self._gadget.functions[player]._report_requested:
+                self._start(player)
+                ready.append(player)
+
+        return ready
 
-    def write(self, state):
-        self.ep1.write(state.bytes)
+    def write(self, state, player=0):
+        self.ep1[player].write(self._report.pack(state.buttons, state.hat, *state.axes))
 
 
 class NullSink(object):
 
+    def __init__(self, players=1):
+        self._ready = list(range(players))
+
     def __enter__(self):
         return self
 
     def __exit__(self, *args):
         pass
 
+    @property
+    def players(self):
+        return len(self._ready)
+
     def poll(self):
         time.sleep(0.01)
-        return True
+        return self._ready
 
-    def write(self, data):
+    def write(self, state, player=0):
         pass
 
-def HAL(port, baud_rate, udc):
-
-    device_params = {
-        'idVendor': '0x0f0d',
-        'idProduct': '0x00c1',
-        'bcdUSB': '0x0200',
-        'bcdDevice': '0x0572',
-        'bDeviceClass': '0x0',
-        'bDeviceSubClass': '0x0',
-        'bDeviceProtocol': '0x0',
-    }
-
-    device_strings = {
-        'manufacturer': 'HORI CO.,LTD.',
-        'product': 'HORIPAD S',
-    }
-
-    report_desc = binascii.unhexlify(
-        "05010905A10115002501350045017501"
-        "950E05091901290E8102950281010501"
-        "2507463B017504950165140939814265"
-        "009501810126FF0046FF000930093109"
-        "320935750895048102750895018101C0"
-    )
+def HAL(port, baud_rate, udc, attach=False, profile=horipad, measure=False, players=1, changes_only=False, keepalive=1.0):
+
+    device_params = profile['device_params']
+    device_strings = profile['device_strings']
+    report_desc = profile['report_desc']
+    report_format = profile['report_format']
+    interval = profile['interval']
+
+    meter = PollRateMeter() if measure else None
+
+    # Backends are imported when they are selected, so only the libraries
+    # needed for the chosen output have to be loaded.
 
     if port == 'functionfs':
-        return GadgetWrapper(Gadget('switchcon', udc, device_params, device_strings, lambda g: HIDFunction(g, report_desc)))
+        from .functionfs import Gadget, HIDFunction
+        return GadgetWrapper(
+            Gadget(
+                'switchcon', udc, device_params, device_strings,
+                lambda g, n: HIDFunction(g, report_desc, interval, n),
+                attach=attach, functions=players
+            ),
+            report_format=report_format, meter=meter
+        )
+
+    elif port == 'pipe':
+        from .pipegadget import PipeGadget, PipeReader, PipeWriter
+        return GadgetWrapper(PipeGadget(report_desc, interval, functions=players), reader=PipeReader, writer=PipeWriter, report_format=report_format, meter=meter)
+
+    elif port == 'null':
+        return NullSink(players)
+
+    elif players > 1:
+        raise ValueError('Only functionfs, pipe and null support more than one player.')
 
     elif port == 'gadgetfs':
+        from .gadgetfs import Gadget as GadgetFS
         if udc == 'dummy_udc.0':
             udc = 'dummy_udc'
-        return GadgetWrapper(GadgetFS(udc, device_params, device_strings, report_desc))
-
-    elif port == 'null':
-        return NullSink()
+        return GadgetWrapper(GadgetFS(udc, device_params, device_strings, report_desc, interval), report_format=report_format, meter=meter)
 
     else:
-        return Serial(port, baud_rate)
\ No newline at end of file
+        return Serial(port, baud_rate, meter=meter, changes_only=changes_only, keepalive=keepalive, interval=interval / 1000)
@@ -17,8 +17,6 @@
 import logging
 import pathlib
 
-import sdl2
-
 from .state import State
 
 logger = logging.getLogger(__name__)
@@ -111,6 +109,9 @@ class MacroManager(object):
                 self.playing_macros[macro] = file(macro)
 
     def key_event(self, key, down):
+        # Keys only come from the SDL window, so sdl2 is already loaded.
+        import sdl2
+
         if key >= sdl2.SDLK_0 and key <= sdl2.SDLK_9:
             button = key - sdl2.SDLK_0
             logger.debug('Passing key to button {:d}'.format(button))
@@ -167,8 +168,8 @@ def file(filename):
             for line in replay:
                 yield State.fromhex(line)
     except FileNotFoundError:
-        logger.error('Macro file "{:s}" does not exist yet.'.format(filename))
-        raise StopIteration
+        logger.error('Macro file "{:s}" does not exist yet.'.format(str(filename)))
+        return
 
 
 def fileloop(filename):
@@ -178,5 +179,5 @@ def fileloop(filename):
                 for line in replay:
                     yield State.fromhex(line)
     except FileNotFoundError:
-        logger.error('Macro file "{:s}" does not exist yet.'.format(filename))
-        raise StopIteration
\ No newline at end of file
+        logger.error('Macro file "{:s}" does not exist yet.'.format(str(filename)))
+        return
\ No newline at end of file
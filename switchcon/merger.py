@@ -0,0 +1,172 @@
+# This file is part of switchcon
+# Copyright (C) 2018  Alistair Buxton <a.j.buxton@gmail.com>
+#
+# switchcon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# switchcon is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with switchcon.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import logging
+import select
+
+from .state import State
+
+logger = logging.getLogger(__name__)
+
+
+BUTTONS = [
+    'y', 'b', 'a', 'x', 'l', 'r', 'zl', 'zr',
+    'select', 'start', 'lclick', 'rclick', 'home', 'capture'
+]
+
+AXES = ['lx', 'ly', 'rx', 'ry']
+
+GROUPS = {
+    'all': BUTTONS + ['hat'] + AXES,
+    'buttons': BUTTONS,
+    'hat': ['hat'],
+    'sticks': AXES,
+    'left': ['lx', 'ly'],
+    'right': ['rx', 'ry'],
+    'face': ['y', 'b', 'a', 'x'],
+    'shoulders': ['l', 'r', 'zl', 'zr'],
+}
+
+
+class Rule(object):
+    """
+    The parts of the state a source controls, compiled to a button mask, a
+    hat flag and a list of axis numbers.
+
+    Buttons from all sources are ORed together. The hat comes from the
+    first source in the list which is not centred. Each axis comes from the
+    source which is pushing it furthest from the centre.
+    """
+
+    def __init__(self, spec='all'):
+        self.spec = spec
+        self.buttons = 0
+        self.hat = False
+        axes = set()
+
+        for name in spec.split(','):
+            name = name.strip()
+            for part in GROUPS.get(name, [name]):
+                if part in BUTTONS:
+                    self.buttons |= 1 << BUTTONS.index(part)
+                elif part == 'hat':
+                    self.hat = True
+                elif part in AXES:
+                    axes.add(AXES.index(part))
+                else:
+                    raise ValueError('Unknown merge rule: {:s}'.format(part))
+
+        self.axes = sorted(axes)
+
+
+class Merger(object):
+    """
+    Combines any number of input sources into one stream of states.
+
+    Event-driven sources (those with event_driven set) report changes
+    through their on_change callback, and only changed sources are
+    re-read. Sources with a fileno() and pump(), such as evdev devices,
+    are pumped from one poll() call. Other sources are iterators and are
+    advanced on every frame.
+    """
+
+    def __init__(self, sources):
+        """sources is a list of (source, Rule) pairs, in priority order."""
+        self._sources = [source for source, rule in sources]
+        self._rules = [rule for source, rule in sources]
+        self._index = {id(source): n for n, source in enumerate(self._sources)}
+        self._states = [State(lx=128, ly=128, rx=128, ry=128) for source in self._sources]
+        self._dirty = set()
+        self._pull = []
+        self._pump = {}
+        self._poller = select.poll()
+
+        for n, source in enumerate(self._sources):
+            if getattr(source, 'event_driven', False):
+                source.on_change = self.on_change
+                self._states[n] = source.state.copy()
+                if hasattr(source, 'pump'):
+                    self._pump[source.fileno()] = source
+                    self._poller.register(source.fileno(), select.POLLIN)
+            else:
+                self._pull.append(n)
+
+        self._merged = self.merge()
+
+    @property
+    def sources(self):
+        return self._sources
+
+    def on_change(self, source):
+        self._dirty.add(self._index[id(source)])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._pump:
+            for fd, event in self._poller.poll(0):
+                self._pump[fd].pump()
+
+        for n in self._pull:
+            self._states[n] = next(self._sources[n]).copy()
+
+        if self._dirty:
+            for n in self._dirty:
+                self._states[n] = self._sources[n].state.copy()
+            self._dirty.clear()
+            self._merged = self.merge()
+        elif self._pull:
+            self._merged = self.merge()
+
+        return self._merged.copy()
+
+    def merge(self):
+        merged = State(lx=128, ly=128, rx=128, ry=128)
+        hat = None
+        deflection = [-1, -1, -1, -1]
+
+        for state, rule in zip(self._states, self._rules):
+            merged.buttons |= state.buttons & rule.buttons
+            if rule.hat and hat is None and state.hat != 8:
+                hat = state.hat
+            for a in rule.axes:
+                d = abs(state._axes[a] - 128)
+                if d > deflection[a]:
+                    deflection[a] = d
+                    merged._axes[a] = state._axes[a]
+
+        if hat is not None:
+            merged.hat = hat
+        return merged
+
+
+def parse_sources(spec):
+    """
+    Split a merged source specification into (source, rule) strings.
+    Sources are joined with '+' and each may have a rule after '@':
+
+        0@sticks,hat+1@buttons
+    """
+    result = []
+    for part in spec.split('+'):
+        if '@' in part:
+            source, rule = part.rsplit('@', 1)
+        else:
+            source, rule = part, 'all'
+        result.append((source, rule))
+    return result
@@ -0,0 +1,369 @@
+# This file is part of switchcon
+# Copyright (C) 2018  Alistair Buxton <a.j.buxton@gmail.com>
+#
+# switchcon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# switchcon is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with switchcon.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import collections
+import logging
+import socket
+import struct
+import threading
+import time
+
+from .functionfs import HIDFunction
+
+logger = logging.getLogger(__name__)
+
+
+# struct usb_functionfs_event: an 8 byte setup packet, event type, 3 bytes padding.
+EVENT = struct.Struct('<BBHHHB3x')
+FUNCTIONFS_SETUP = 4
+
+
+def seqpacket_pair():
+    """
+    Returns a (device, host) pair of connected sockets. SOCK_SEQPACKET
+    behaves like a pipe in both directions, but keeps packet boundaries,
+    so one send() is one USB transfer.
+    """
+    return socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+
+
+class PipeEndpoint0(object):
+    """Device side of ep0. Events are read from the host, replies are written back."""
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._sock.setblocking(False)
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def read(self, length):
+        try:
+            return self._sock.recv(length)
+        except BlockingIOError:
+            return None
+
+    def readinto(self, buf):
+        try:
+            return self._sock.recv_into(buf)
+        except BlockingIOError:
+            return None
+
+    def write(self, data):
+        self._sock.send(data)
+
+    def halt(self, request_type):
+        # A zero length reply stands in for a protocol stall.
+        self._sock.send(b'')
+
+    def close(self):
+        self._sock.close()
+
+
+class PipeReader(object):
+    """
+    Stand-in for KAIOReader. Reads are always armed, so submit() does
+    nothing, and evfd is the socket itself.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._sock.setblocking(False)
+        self.evfd = sock.fileno()
+
+    def fileno(self):
+        return self.evfd
+
+    def submit(self):
+        pass
+
+    def read(self):
+        return bytearray(self._sock.recv(512))
+
+    def close(self):
+        # Like KAIOReader, the endpoint belongs to the function, which closes
+        # it once the host has stopped.
+        pass
+
+
+class PipeWriter(object):
+    """
+    Stand-in for KAIOWriter. Each write completes when the host polls the
+    endpoint and sends back an acknowledgement, which makes evfd readable.
+    The time from write() to pump() is recorded for every report.
+    """
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._sock.setblocking(False)
+        self.evfd = sock.fileno()
+        self._pending = collections.deque()
+        self.completed = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def fileno(self):
+        return self.evfd
+
+    def write(self, buf):
+        self._pending.append(time.perf_counter())
+        self._sock.send(bytes(buf))
+
+    def pump(self):
+        now = time.perf_counter()
+        while True:
+            try:
+                self._sock.recv(1)
+            except BlockingIOError:
+                break
+            latency = now - self._pending.popleft()
+            self.completed += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def close(self):
+        # See PipeReader.close().
+        pass
+
+
+class PipeHIDFunction(HIDFunction):
+    """
+    HIDFunction running on pipes instead of a functionfs mount. Event
+    processing and onSetup are the real ones; only opening the endpoints
+    is replaced.
+    """
+
+    def __init__(self, gadget, report_desc, ep_list):
+        # Deliberately skip functionfs.Function.__init__, which opens the
+        # endpoint files under the mount point.
+        self.gadget = gadget
+        self.report_desc = report_desc
+        self._report_requested = False
+        self.start_on_enable = False
+        self._ep_list = ep_list
+        self._ep_address_dict = {}
+        self._closed = False
+
+
+class Host(threading.Thread):
+    """
+    Simulates the USB host. It asks for the HID report descriptor, then
+    polls the IN endpoint every interval ms and sends an OUT packet every
+    out_interval seconds.
+    """
+
+    def __init__(self, ep0, ep1, ep2, descriptor_length, interval=5, out_interval=1.0):
+        super().__init__(daemon=True)
+        self.ep0 = ep0
+        self.ep1 = ep1
+        self.ep2 = ep2
+        self.descriptor_length = descriptor_length
+        self.interval = interval
+        self.out_interval = out_interval
+
+        self.descriptor = None
+        self.last_report = None
+        self.polls = 0
+        self.reports = 0
+        self.out_packets = 0
+
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def run(self):
+        self.ep0.settimeout(1.0)
+        self.ep1.setblocking(False)
+
+        # GET_DESCRIPTOR for the HID report descriptor.
+        self.ep0.send(EVENT.pack(0x81, 0x6, 0x2200, 0, self.descriptor_length, FUNCTIONFS_SETUP))
+        try:
+            self.descriptor = self.ep0.recv(4096)
+        except socket.timeout:
+            logger.error('Device did not send the report descriptor.')
+            return
+        except OSError:
+            return  # Device closed before enumeration finished.
+
+        next_poll = time.perf_counter()
+        next_out = next_poll + self.out_interval if self.out_interval else None
+
+        while True:
+            next_poll += self.interval / 1000
+            delay = next_poll - time.perf_counter()
+            if self._stop_event.wait(max(delay, 0)):
+                return
+
+            send_out = next_out is not None and next_poll >= next_out
+            if send_out:
+                next_out += self.out_interval
+
+            try:
+                self.poll(send_out)
+            except OSError:
+                logger.debug('Device closed the endpoints.')
+                return
+
+    def poll(self, send_out):
+        self.polls += 1
+        try:
+            self.last_report = self.ep1.recv(64)
+        except BlockingIOError:
+            pass  # NAK: nothing queued for this interval
+        else:
+            self.reports += 1
+            self.ep1.send(b'\x01')
+
+        if send_out:
+            self.ep2.send(bytes(8))
+            self.out_packets += 1
+
+
+class PipeGadget(object):
+    """
+    A gadget which can be driven by GadgetWrapper with PipeReader and
+    PipeWriter in place of the KAIO endpoints. Each function gets its own
+    simulated host, which is started on enter and stopped on exit.
+    """
+
+    def __init__(self, report_desc, interval=5, out_interval=1.0, functions=1):
+        self._report_desc = report_desc
+        self._interval = interval
+        self._out_interval = out_interval
+        self._count = functions
+        self._functions = []
+        self.hosts = []
+
+    def __enter__(self):
+        for n in range(self._count):
+            ep0, host_ep0 = seqpacket_pair()
+            ep1, host_ep1 = seqpacket_pair()
+            ep2, host_ep2 = seqpacket_pair()
+
+            self._functions.append(PipeHIDFunction(self, self._report_desc, [PipeEndpoint0(ep0), ep1, ep2]))
+            self.hosts.append(Host(host_ep0, host_ep1, host_ep2, len(self._report_desc), self._interval, self._out_interval))
+
+        for host in self.hosts:
+            host.start()
+        return self
+
+    def __exit__(self, *args):
+        for host in self.hosts:
+            host.stop()
+            for sock in (host.ep0, host.ep1, host.ep2):
+                sock.close()
+        for function in self._functions:
+            function.close()
+
+    @property
+    def functions(self):
+        return self._functions
+
+    @property
+    def host(self):
+        return self.hosts[0]
+
+
+def benchmark(reports=1000, interval=1):
+    """Push reports through GadgetWrapper to a simulated host and print throughput and latency."""
+    from .hal import GadgetWrapper
+    from .profiles import horipad
+    from .state import State
+
+    state = State()
+    with GadgetWrapper(PipeGadget(horipad['report_desc'], interval), reader=PipeReader, writer=PipeWriter) as wrapper:
+        while not wrapper.poll():
+            pass
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        for n in range(reports):
+            while not wrapper.poll():
+                pass
+            state.buttons = n & 0x3fff
+            wrapper.write(state)
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        writer = wrapper.ep1[0]
+
+    print('{:d} reports in {:.3f} s: {:.1f} reports/s, host polled every {:d} ms'.format(
+        reports, elapsed, reports / elapsed, interval
+    ))
+    print('write to completion latency: mean {:.3f} ms, max {:.3f} ms'.format(
+        1000 * writer.latency_total / max(writer.completed, 1), 1000 * writer.latency_max
+    ))
+    print('CPU time: {:.3f} s ({:.1f} us per report)'.format(cpu, 1e6 * cpu / reports))
+
+
+def check(reports=100, interval=1, timeout=10.0):
+    """
+    Push reports through GadgetWrapper to a simulated host and check that
+    the host got the report descriptor and every report, with the last one
+    intact. Returns a list of problems, which is empty if it all worked.
+    Needs no hardware or root, so it can run in CI.
+    """
+    from .hal import GadgetWrapper
+    from .profiles import horipad
+    from .state import State
+
+    problems = []
+    state = State()
+    deadline = time.perf_counter() + timeout
+    gadget = PipeGadget(horipad['report_desc'], interval)
+    with GadgetWrapper(gadget, reader=PipeReader, writer=PipeWriter) as wrapper:
+        host = gadget.host
+        sent = 0
+        while sent < reports and time.perf_counter() < deadline:
+            if wrapper.poll():
+                state.buttons = sent & 0x3fff
+                state.axes = [sent & 0xff, 0xff - (sent & 0xff), 127, 127]
+                wrapper.write(state)
+                sent += 1
+        # wait for the host to read the last report
+        while wrapper.ep1[0] is not None and wrapper.ep1[0].completed < sent + 1 and time.perf_counter() < deadline:
+            wrapper.poll()
+
+        if host.descriptor != horipad['report_desc']:
+            problems.append('host got the wrong report descriptor')
+        # the first report is the neutral state written when the host starts polling
+        if host.reports != sent + 1 or sent != reports:
+            problems.append('host got {:d} of {:d} reports'.format(max(host.reports - 1, 0), reports))
+        if host.last_report != state.bytes:
+            problems.append('last report was {!r}, expected {!r}'.format(host.last_report, state.bytes))
+
+    return problems
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Benchmark the gadget path against a simulated USB host.')
+    parser.add_argument('-n', '--reports', type=int, default=1000, help='Number of reports to send. Default: 1000.')
+    parser.add_argument('-i', '--interval', type=int, default=1, help='Host polling interval in ms. Default: 1.')
+    parser.add_argument('-c', '--check', action='store_true', help='Check that the reports arrive instead of benchmarking. Exits non-zero on failure.')
+    args = parser.parse_args()
+
+    if args.check:
+        problems = check(args.reports, args.interval)
+        for problem in problems:
+            print(problem)
+        print('FAIL' if problems else 'OK')
+        sys.exit(1 if problems else 0)
+
+    benchmark(args.reports, args.interval)
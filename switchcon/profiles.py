@@ -0,0 +1,74 @@
+# This file is part of switchcon
+# Copyright (C) 2018  Alistair Buxton <a.j.buxton@gmail.com>
+#
+# switchcon is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# switchcon is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with switchcon.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import binascii
+import json
+
+# A profile describes the USB device we present to the console:
+#   device_params:  device descriptor fields, as configfs strings.
+#   device_strings: manufacturer and product strings.
+#   report_desc:    the HID report descriptor.
+#   report_format:  struct format used to pack buttons, hat, lx, ly, rx, ry into a report.
+#   interval:       bInterval of the interrupt endpoints, in ms.
+
+horipad = {
+    'device_params': {
+        'idVendor': '0x0f0d',
+        'idProduct': '0x00c1',
+        'bcdUSB': '0x0200',
+        'bcdDevice': '0x0572',
+        'bDeviceClass': '0x0',
+        'bDeviceSubClass': '0x0',
+        'bDeviceProtocol': '0x0',
+    },
+    'device_strings': {
+        'manufacturer': 'HORI CO.,LTD.',
+        'product': 'HORIPAD S',
+    },
+    'report_desc': binascii.unhexlify(
+        "05010905A10115002501350045017501"
+        "950E05091901290E8102950281010501"
+        "2507463B017504950165140939814265"
+        "009501810126FF0046FF000930093109"
+        "320935750895048102750895018101C0"
+    ),
+    'report_format': '<HBBBBB',
+    'interval': 5,
+}
+
+profiles = {
+    'horipad': horipad,
+    # The Switch accepts shorter polling intervals than the Hori pad asks for.
+    'horipad-2ms': dict(horipad, interval=2),
+    'horipad-1ms': dict(horipad, interval=1),
+}
+
+
+def load_profile(name):
+    """
+    Returns the named built-in profile, or loads one from a JSON file. In
+    a file, report_desc is a hex string and any missing keys are taken
+    from the horipad profile.
+    """
+    if name in profiles:
+        return profiles[name]
+
+    with open(name, 'r') as f:
+        data = json.load(f)
+    if 'report_desc' in data:
+        data['report_desc'] = binascii.unhexlify(data['report_desc'])
+    return dict(horipad, **data)
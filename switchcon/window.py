@@ -16,6 +16,9 @@
 
 
 import logging
+import math
+import threading
+import time
 
 import sdl2
 import sdl2.ext
@@ -25,18 +28,56 @@ from .state import State
 logger = logging.getLogger(__name__)
 
 
-class Window(object):
+def fill(surface, color, rects):
+    """Fill a list of (x, y, w, h) rects on a surface in one SDL_FillRects call."""
+    array = (sdl2.SDL_Rect * len(rects))(*[sdl2.SDL_Rect(*r) for r in rects])
+    sdl2.SDL_FillRects(surface, array, len(rects), sdl2.SDL_MapRGB(surface.format, *color))
+
+
+def line_rects(lines):
+    """Returns one pixel wide rects for horizontal and vertical lines given as (x1, y1, x2, y2)."""
+    return [(min(x1, x2), min(y1, y2), abs(x2 - x1) + 1, abs(y2 - y1) + 1) for x1, y1, x2, y2 in lines]
 
 
+def outline(rects):
+    """Returns the four one pixel edges of each rect, for drawing with a single fill()."""
+    edges = []
+    for x, y, w, h in rects:
+        edges += [(x, y, w, 1), (x, y + h - 1, w, 1), (x, y, 1, h), (x + w - 1, y, 1, h)]
+    return edges
 
-    def __init__(self, div=2, padding=6):
+
+class Window(object):
+    """
+    Preview of the controller state, with one panel per player laid out in
+    a grid.
+
+    update() only records the latest state, so it is cheap enough to call
+    for every report. A separate thread draws the latest states into an
+    off-screen surface at most fps times a second, and present() copies
+    the finished frame to the window. present() never waits for the
+    drawing thread; if a frame is being drawn it returns and the frame is
+    shown on a later call. States which were replaced by a different one
+    before they were drawn are counted in dropped; repeats of the same
+    state are not, since nothing was lost.
+
+    Everything which doesn't depend on the state is drawn once into a
+    background surface. Each frame copies the background and then draws
+    the stick and hat dots and pressed buttons of every panel in a
+    single fill.
+    """
+
+    # Position of the hat dot for each hat value, on the same 0-255 scale as the sticks.
+    hatpositions = [(128, 0), (255, 0), (255, 128), (255, 255), (128, 255), (0, 255), (0, 128), (0, 0)]
+
+    def __init__(self, div=2, padding=6, fps=60, players=1, columns=None):
 
         self.div = div
         size = 256 >> div
         width = (3 * size) + (4 * padding)
         height = size + (2 * padding)
 
-        # calculate coordinates and save them for drawing later
+        # calculate coordinates within a panel and save them for drawing later
         self.lstick = (padding, padding, size, size)
         self.rstick = ((2 * padding) + size, padding, size, size)
         self.dstick = ((3 * padding) + (2*size), padding, size, size)
@@ -53,57 +94,129 @@ class Window(object):
 
         height += padding + (32>>div)
 
+        # top left corner of each player's panel
+        if columns is None:
+            columns = math.ceil(math.sqrt(players))
+        rows = math.ceil(players / columns)
+        self.panels = [((n % columns) * width, (n // columns) * height) for n in range(players)]
+
         sdl2.ext.init()
 
-        self.window = sdl2.ext.Window('Switch Controller', size=(width, height))
+        self.window = sdl2.ext.Window('Switch Controller', size=(width * columns, height * rows))
         self.window.show()
-        self.renderer = sdl2.ext.Renderer(self.window)
-
-        self.prev_state = None
-        self.update(State())
-
-    def update(self, state):
-        """Draw the supplied controller state in the SDL window."""
-        if state != self.prev_state:
-            self.renderer.clear((255, 255, 255))
-            for p in self.centrelines:
-                self.renderer.draw_line(p, (200, 200, 200))
-            self.renderer.draw_rect([self.lstick, self.rstick, self.dstick], (0, 0, 0))
-            self.renderer.fill([
-                (self.lstick[0] + (state.lx>>self.div) - 4, self.lstick[1] + (state.ly>>self.div) - 4, 9, 9),
-                (self.rstick[0] + (state.rx>>self.div) - 4, self.rstick[1] + (state.ry>>self.div) - 4, 9, 9),
-            ], (255, 0, 0))
-
-            self.renderer.draw_rect(self.buttons, (0, 0, 0))
-            for n,b in enumerate(self.buttons):
-                if state.buttons&(1<<n):
-                    self.renderer.fill((b[0]+1, b[1]+1, b[2]-2, b[3]-2), (255, 0, 0))
-
-            hatx, haty = 128, 128
-
-            if state.hat == 0:
-                hatx, haty = 128, 0
-            if state.hat == 1:
-                hatx, haty = 255, 0
-            if state.hat == 2:
-                hatx, haty = 255, 128
-            if state.hat == 3:
-                hatx, haty = 255, 255
-            if state.hat == 4:
-                hatx, haty = 128, 255
-            if state.hat == 5:
-                hatx, haty = 0, 255
-            if state.hat == 6:
-                hatx, haty = 0, 128
-            if state.hat == 7:
-                hatx, haty = 0, 0
-
-            self.renderer.fill((self.dstick[0] + (hatx>>self.div) - 4, self.dstick[1] + (haty>>self.div) - 4, 9, 9), (255, 0, 0))
-
-            self.renderer.present()
-
-            self.prev_state = state.copy()
+        self.surface = self.window.get_surface()
+
+        # The drawing thread draws into frame, and present() copies it to the window.
+        self.background = self.create_surface()
+        self.frame = self.create_surface()
+        self.draw_background()
+
+        self.frames = 0
+        self.dropped = 0
+
+        self._period = 1 / fps
+        self._latest = [State() for n in range(players)]
+        self._taken = [False] * players
+        # Guards _latest and _taken, which update() and the drawing thread both write.
+        self._state_lock = threading.Lock()
+        self._ready = False
+        self._frame_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._wake.set()
+        self._stop = False
+
+        self.prev_states = None
+
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def create_surface(self):
+        fmt = self.surface.format.contents
+        return sdl2.SDL_CreateRGBSurface(
+            0, self.surface.w, self.surface.h, fmt.BitsPerPixel, fmt.Rmask, fmt.Gmask, fmt.Bmask, fmt.Amask
+        ).contents
+
+    def update(self, state, player=0):
+        """Record the state to be drawn on the next frame."""
+        state = state.copy()
+        with self._state_lock:
+            if not self._taken[player] and state != self._latest[player]:
+                self.dropped += 1
+            self._latest[player] = state
+            self._taken[player] = False
+        self._wake.set()
+
+    def present(self):
+        """Show the last drawn frame, if there is a new one. Never blocks."""
+        if self._ready and self._frame_lock.acquire(blocking=False):
+            try:
+                sdl2.SDL_BlitSurface(self.frame, None, self.surface, None)
+                self._ready = False
+            finally:
+                self._frame_lock.release()
+            self.window.refresh()
+
+    def close(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+        sdl2.SDL_FreeSurface(self.frame)
+        sdl2.SDL_FreeSurface(self.background)
+
+    def run(self):
+        next_frame = time.perf_counter()
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stop:
+                return
+
+            # Limit the frame rate. States which arrive while waiting replace each other.
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_frame = max(next_frame + self._period, time.perf_counter())
+
+            with self._state_lock:
+                states = list(self._latest)
+                self._taken = [True] * len(states)
+            if states != self.prev_states:
+                with self._frame_lock:
+                    self.draw(states)
+                    self._ready = True
+                self.frames += 1
+                self.prev_states = states
+
+    def draw_background(self):
+        """Draw the parts of every panel which never change."""
+        background = self.background
+        lines = []
+        boxes = []
+        for x, y in self.panels:
+            lines += [(x + x1, y + y1, x + x2, y + y2) for x1, y1, x2, y2 in self.centrelines]
+            boxes += [(x + bx, y + by, w, h) for bx, by, w, h in [self.lstick, self.rstick, self.dstick] + self.buttons]
+
+        fill(background, (255, 255, 255), [(0, 0, background.w, background.h)])
+        fill(background, (200, 200, 200), line_rects(lines))
+        fill(background, (0, 0, 0), outline(boxes))
+
+    def draw(self, states):
+        """Draw the supplied controller states into the frame surface."""
+        sdl2.SDL_BlitSurface(self.background, None, self.frame, None)
+
+        div = self.div
+        dots = []
+        for (x, y), state in zip(self.panels, states):
+            hatx, haty = Window.hatpositions[state.hat] if state.hat < 8 else (128, 128)
+            dots += [
+                (x + self.lstick[0] + (state.lx>>div) - 4, y + self.lstick[1] + (state.ly>>div) - 4, 9, 9),
+                (x + self.rstick[0] + (state.rx>>div) - 4, y + self.rstick[1] + (state.ry>>div) - 4, 9, 9),
+                (x + self.dstick[0] + (hatx>>div) - 4, y + self.dstick[1] + (haty>>div) - 4, 9, 9),
+            ]
+            dots += [(x + b[0]+1, y + b[1]+1, b[2]-2, b[3]-2) for n,b in enumerate(self.buttons) if state.buttons&(1<<n)]
+
+        fill(self.frame, (255, 0, 0), dots)
 
 
 class WindowClosed(Exception):
-    pass
\ No newline at end of file
+    pass